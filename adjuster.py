@@ -5,8 +5,8 @@
 # Source code: https://github.com/con-mcleod/MonthlyPerf_Report
 # Latest Update: 10 August 2018
 
-import sys, csv, sqlite3, os, glob, re
-from xlrd import open_workbook
+import sqlite3, argparse, itertools
+import schema, runstats, catalog
 
 ##############################
 #                            #
@@ -14,32 +14,25 @@ from xlrd import open_workbook
 #                            #
 ##############################
 
-def create_tables(cxn):
+def create_tables(cxn, incremental=False):
 	"""
 	Function to create tables in sqlite3
 	:param cxn: the connection to the sqlite3 database
+	:param incremental: keep the existing tables to update them in place
 	:return:
 	"""
 
 	cursor = cxn.cursor()
 
-	cursor.execute("DROP TABLE IF EXISTS ADJ_FORECAST")
-	cursor.execute("DROP TABLE IF EXISTS MONTH_GEN")
+	if not incremental:
+		cursor.execute("DROP TABLE IF EXISTS ADJ_FORECAST")
+		cursor.execute("DROP TABLE IF EXISTS MONTH_GEN")
 
-	cursor.execute("""CREATE TABLE IF NOT EXISTS ADJ_FORECAST(
-		SMI varchar(10),
-		month int,
-		year int,
-		adj_val float
-		)""")
-
-	cursor.execute("""CREATE TABLE IF NOT EXISTS MONTH_GEN(
-		SMI varchar(10),
-		month int,
-		year int,
-		val float,
-		unique(SMI, month, year)
-		)""")
+	schema.create_table(cxn, "ADJ_FORECAST")
+	schema.create_table(cxn, "MONTH_GEN")
+	schema.create_table(cxn, "PERF_SUMMARY")
+	schema.create_table(cxn, "DIRTY_CELLS")
+	schema.create_table(cxn, "DIRTY_SMIS")
 
 	cursor.close()
 
@@ -88,142 +81,438 @@ def dbexecute(cxn, query, payload):
 #                            #
 ##############################
 
-def get_all_SMIs(cxn):
+def get_unsupplied_SMIs(cxn):
 	"""
-	Function to grab all SMIs from the Encompass reports
+	Function to find the SMIs from the Encompass reports without a supply date in Salesforce
 	:param cxn: connection to sqlite3 database
-	:return all_SMIs: list of all SMIs
+	:return result: list of SMIs with no supply date
 	"""
-	query = "SELECT distinct(SMI) from DAILY_GEN"
+	query = """SELECT c.SMI from SMI_CATALOG c left join SMI_DETAILS s on s.SMI = c.SMI
+			where s.supply_date is null or s.supply_date = ''"""
 	payload = None
-	all_SMIs = dbselect(cxn, query, payload)
-	return all_SMIs
+	result = dbselect(cxn, query, payload)
+	return result
+
+##############################
+#                            #
+# Set-based adjustment       #
+#                            #
+##############################
+
+# hardcoded solution for the solar farm sites and their degradation by year
+solarFarms = ["6203778594", "6203779394"]
+solarFarmFactors = {16: 0.933, 17: 0.926, 18: 0.919}
+
+# the supply date split into year/month/day the same way as the 'YYYY.MM.DD' string
+# was sliced per SMI
+SUPPLY_CTE = """
+	supply AS (SELECT SMI,
+			cast(substr(supply_date, 3, 2) as integer) as supply_year,
+			cast(substr(supply_date, 6, 2) as integer) as supply_month,
+			cast(substr(supply_date, 9, 2) as integer) as supply_day
+		from SMI_DETAILS where supply_date is not null and supply_date != '')"""
+
+# every SMI and month in the Encompass reports
+ALL_CELLS_CTE = """
+	smis AS (SELECT SMI from SMI_CATALOG),
+	months AS (SELECT obs_month as month, obs_year as year from MONTH_CATALOG),
+	cells AS (SELECT c.SMI, m.month, m.year from smis c cross join months m)"""
 
+# the number of days in the month of a cell, with the leap years the reports cover
+DAYS_IN_MONTH = """(case when c.month in (1,3,5,7,8,10,12) then 31
+		when c.month in (4,6,9,11) then 30
+		when c.year in (16,20,24,28) then 29 else 28 end)"""
 
-def get_all_months(cxn):
+
+def cells_cte(cells):
+	"""
+	Function to return the sql naming the (SMI, month, year) cells to build
+	:param cells: table of cells to build, or None for every SMI and month
+	:return: the cells common table expression
+	"""
+	if cells is None:
+		return ALL_CELLS_CTE
+	return """
+	cells AS (SELECT SMI, month, year from """ + cells + """)"""
+
+
+def month_gen_query(cells=None):
 	"""
-	Function to return all months included in the Encompass reports
+	Function to return the statement that builds MONTH_GEN for supplied SMIs
+	Generation before the supply month is zero and generation in the supply month
+	only counts days from the supply day. Each cell is summed over one range of
+	DAILY_READINGS' (smi_id, day) key, starting from the supply day in the supply month,
+	so each month is summed in day order, exactly as the per-month queries used to add it up
+	:param cells: table of (SMI, month, year) cells to rebuild, or None for all of them
+	:return query: the INSERT statement, which takes no parameters
+	"""
+	query = """INSERT OR REPLACE INTO MONTH_GEN(SMI, month, year, val)
+		WITH""" + cells_cte(cells) + "," + SUPPLY_CTE + """
+		SELECT c.SMI, c.month, c.year,
+			case when c.year < s.supply_year
+					or (c.year = s.supply_year and c.month < s.supply_month) then 0
+				else (SELECT sum(r.value) from DAILY_READINGS r where r.smi_id = i.smi_id
+					and r.day between c.year*10000 + c.month*100 + (case when c.year = s.supply_year
+						and c.month = s.supply_month then s.supply_day else 0 end)
+					and c.year*10000 + c.month*100 + 99) end
+		from cells c join supply s on s.SMI = c.SMI
+		left join SMI_DIM i on i.SMI = c.SMI"""
+	return query
+
+
+def build_month_gen(cxn, cells=None):
+	"""
+	Function to build MONTH_GEN for supplied SMIs in one statement
 	:param cxn: connection to sqlite3 database
-	:return all_dates: list of all months in report [mm, yy]
+	:param cells: table of (SMI, month, year) cells to rebuild, or None for all of them
+	:return:
 	"""
-	query = """SELECT obs_month, obs_year from DAILY_GEN 
-			group by obs_month, obs_year order by obs_year, obs_month"""
+	query = month_gen_query(cells)
 	payload = None
-	all_dates = dbselect(cxn, query, payload)
-	return all_dates
+	dbexecute(cxn, query, payload)
 
 
-def create_month_gen(cxn, SMI, date):
+def adj_forecast_query(cells=None):
+	"""
+	Function to return the statement that builds ADJ_FORECAST and its parameters
+	The forecast is zero before the supply month and pro-rated by the supply day in
+	the supply month; sites without a supply date keep their forecast, and the solar
+	farms take their forecast scaled by the degradation factor for the year
+	:param cells: table of (SMI, month, year) cells to rebuild, or None for all of them
+	:return: tuple of (INSERT statement, payload)
 	"""
-	Function to create the monthly generation for an SMI in a given month
+	payload = list(solarFarms)
+	solar_case = "case c.year"
+	for year, factor in solarFarmFactors.items():
+		solar_case += " when ? then ? * f.val"
+		payload.extend([year, factor])
+	solar_case += " else f.val end"
+
+	query = """INSERT OR REPLACE INTO ADJ_FORECAST(SMI, month, year, adj_val)
+		WITH""" + cells_cte(cells) + "," + SUPPLY_CTE + """
+		SELECT c.SMI, c.month, c.year,
+			case when s.SMI is null then f.val
+				when c.SMI in (""" + ",".join(["?"]*len(solarFarms)) + """) then """ + solar_case + """
+				when c.year < s.supply_year
+					or (c.year = s.supply_year and c.month < s.supply_month) then 0
+				when c.year = s.supply_year and c.month = s.supply_month
+					then f.val * (1 - (cast(s.supply_day as real) / """ + DAYS_IN_MONTH + """))
+				else f.val end
+		from cells c
+		left join supply s on s.SMI = c.SMI
+		left join FORECAST f on f.SMI = c.SMI and f.month = c.month"""
+	return query, payload
+
+
+def build_adj_forecast(cxn, cells=None):
+	"""
+	Function to build ADJ_FORECAST in one statement
 	:param cxn: connection to sqlite3 database
-	:param SMI: the SMI of interest
-	:param date: the month and year of interest
-	:return result: the monthly generation
-	"""
-	month = date[0]
-	year = date[1]
-	query = """SELECT sum(value), datatype from DAILY_GEN where SMI=? and 
-			obs_month=? and obs_year=?"""
-	payload = (SMI[0], month, year,)
-	result = dbselect(cxn, query, payload)
-	return result
+	:param cells: table of (SMI, month, year) cells to rebuild, or None for all of them
+	:return:
+	"""
+	query, payload = adj_forecast_query(cells)
+	dbexecute(cxn, query, payload)
 
+##############################
+#                            #
+# Incremental adjustment     #
+#                            #
+##############################
 
-def get_adj_month_gen(cxn, SMI, date, supply_day):
+# the changes recorded since the last run, the cells already built, and the statements
+# clearing a cell, an SMI or a month of MONTH_GEN or ADJ_FORECAST ({table})
+DIRTY_CELLS_SELECT = "SELECT SMI, month, year from DIRTY_CELLS"
+DIRTY_SMIS_SELECT = "SELECT SMI from DIRTY_SMIS"
+BUILT_SMIS_SELECT = "SELECT distinct(SMI) from ADJ_FORECAST"
+BUILT_MONTHS_SELECT = "SELECT month, year from ADJ_FORECAST group by year, month"
+CLEAR_CELL = "DELETE FROM {table} where SMI=? and month=? and year=?"
+CLEAR_SMI = "DELETE FROM {table} where SMI=?"
+CLEAR_MONTH = "DELETE FROM {table} where month=? and year=?"
+
+def get_dirty_cells(cxn):
 	"""
-	Function to return an SMI's monthly generation with it's supply date
-	occuring in that month
+	Function to return the (SMI, month, year) cells touched by ingest since the last adjustment
 	:param cxn: connection to sqlite3 database
-	:param SMI: the SMI of interest
-	:param date: the month and year of interest
-	:param supply_day: the supply date for the SMI to adjust generation to
-	:return result: the adjusted monthly generation having removed generation before supply date
-	"""
-	month = date[0]
-	year = date[1]
-	query = """SELECT sum(value), datatype from DAILY_GEN where SMI=? and
-			obs_month=? and obs_year=? and obs_day>=?"""
-	payload = (SMI[0], month, year, supply_day)
+	:return result: list of (SMI, month, year)
+	"""
+	query = DIRTY_CELLS_SELECT
+	payload = None
 	result = dbselect(cxn, query, payload)
 	return result
 
 
-def get_supply_date(cxn, SMI):
+def get_dirty_SMIs(cxn):
 	"""
-	Function to get the supply date of an SMI from the Salesforce data
+	Function to return the SMIs whose Salesforce details or forecast changed since the last adjustment
 	:param cxn: connection to sqlite3 database
-	:param SMI: the SMI of interest
-	:return result: the supply date string
+	:return result: list of SMIs
 	"""
-	query = "SELECT supply_date from SMI_DETAILS where SMI=?"
-	payload = (SMI)
+	query = DIRTY_SMIS_SELECT
+	payload = None
 	result = dbselect(cxn, query, payload)
 	return result
 
 
-def get_forecast(cxn, SMI, month):
+def get_built_cells(cxn):
 	"""
-	Function to get the forecast for the given SMI in a specific month
+	Function to return the SMIs and months already in ADJ_FORECAST
 	:param cxn: connection to sqlite3 database
-	:param SMI: the SMI of interest:
-	:param month: the month of interest
-	:return result: the forecast value for that SMI for that month
+	:return: tuple of (set of SMIs, set of (month, year))
 	"""
-	query = "SELECT val from FORECAST where SMI=? and month=?"
-	payload = (SMI, month)
-	result = dbselect(cxn, query, payload)
+	SMIs = set([row[0] for row in dbselect(cxn, BUILT_SMIS_SELECT, None)])
+	dates = set(dbselect(cxn, BUILT_MONTHS_SELECT, None))
+	return SMIs, dates
+
+
+def clear_dirty(cxn):
+	"""
+	Function to forget the recorded changes once they have been adjusted
+	:param cxn: connection to sqlite3 database
+	:return:
+	"""
+	dbexecute(cxn, "DELETE FROM DIRTY_CELLS", None)
+	dbexecute(cxn, "DELETE FROM DIRTY_SMIS", None)
+
+
+def adjust_incremental(cxn, SMIs, dates):
+	"""
+	Function to recompute only the cells affected by changes since the last adjustment
+	These are the cells touched by ingest, every month of an SMI whose Salesforce data
+	changed, every month of a new SMI and every SMI for a new month
+	:param cxn: connection to sqlite3 database
+	:param SMIs: list of all SMIs in the Encompass reports
+	:param dates: list of all (month, year) in the Encompass reports
+	:return: the number of cells rebuilt
+	"""
+	SMIs = [SMI[0] for SMI in SMIs]
+	built_SMIs, built_dates = get_built_cells(cxn)
+	stale_SMIs = built_SMIs - set(SMIs)
+	stale_dates = built_dates - set(dates)
+
+	work = set([(SMI, month, year) for SMI, month, year in get_dirty_cells(cxn)])
+	changed_SMIs = set([SMI[0] for SMI in get_dirty_SMIs(cxn)])
+	changed_SMIs |= set([SMI for SMI in SMIs if SMI not in built_SMIs])
+	for SMI in changed_SMIs:
+		work |= set([(SMI, date[0], date[1]) for date in dates])
+	for date in dates:
+		if date not in built_dates:
+			work |= set([(SMI, date[0], date[1]) for SMI in SMIs])
+
+	# clear out every affected cell, including SMIs and months no longer reported
+	cursor = cxn.cursor()
+	for table in ["MONTH_GEN", "ADJ_FORECAST"]:
+		cursor.executemany(CLEAR_CELL.format(table=table), work)
+		cursor.executemany(CLEAR_SMI.format(table=table), [(SMI,) for SMI in stale_SMIs])
+		cursor.executemany(CLEAR_MONTH.format(table=table), stale_dates)
+
+	# and rebuild the ones still covered by the Encompass reports
+	SMI_set = set(SMIs)
+	date_set = set(dates)
+	cursor.execute("DROP TABLE IF EXISTS temp.ADJ_WORK")
+	schema.create_table(cxn, "DIRTY_CELLS", table="temp.ADJ_WORK")
+	cells = [cell for cell in work if cell[0] in SMI_set and (cell[1], cell[2]) in date_set]
+	cursor.executemany("INSERT INTO temp.ADJ_WORK(SMI, month, year) VALUES (?,?,?)", cells)
+	cursor.close()
+
+	build_month_gen(cxn, "temp.ADJ_WORK")
+	build_adj_forecast(cxn, "temp.ADJ_WORK")
+	dbexecute(cxn, "DROP TABLE temp.ADJ_WORK", None)
+	return len(cells)
+
+##############################
+#                            #
+# Performance summary        #
+#                            #
+##############################
+
+# the report periods in the order genMonthlyReport.py lays them out
+perfPeriods = ["Annual", "Quarter", "Month", "Prev"]
+
+# each SMI's monthly forecasts and generation in SMI order, as the reports also read them
+FORECAST_BY_SMI = "SELECT SMI, adj_val from ADJ_FORECAST order by SMI, year, month"
+GEN_BY_SMI = "SELECT SMI, val from MONTH_GEN order by SMI, year, month"
+
+
+def get_values_by_SMI(cxn, query):
+	"""
+	Function to group the ordered values of a monthly table by SMI in one pass
+	:param cxn: connection to sqlite3 database
+	:param query: SELECT of (SMI, value) ordered by SMI, year, month
+	:return result: dictionary of SMI to its list of monthly values
+	"""
+	result = {}
+	rows = dbselect(cxn, query, None)
+	for SMI, group in itertools.groupby(rows, key=lambda row: row[0]):
+		result[SMI] = [row[1] for row in group]
 	return result
 
 
-def get_days_in_month(month, year):
+def get_period_values(vals, period):
 	"""
-	Function to return the number of days in a month given a month and year
-	:param month: the month of interest
-	:param year: the year of interest
-	:return: number of days in the given month
+	Function to cut an SMI's monthly values down to a report period
+	:param vals: the SMI's monthly values ordered by year, month
+	:param period: the period of interest (Annual, Quarter, Month, Prev)
+	:return: list of values in the period
 	"""
-	if month in [1,3,5,7,8,10,12]:
-		return 31
-	elif month in [4,6,9,11]:
-		return 30
-	else:
-		if year in [16, 20, 24, 28]:
-			return 29
-		else:
-			return 28
+	if period == "Annual":
+		return vals[-12:]
+	elif period == "Quarter":
+		return vals[-3:]
+	elif period == "Month":
+		return vals[-1:]
+	elif len(vals) > 1:
+		return [vals[-2]]
+	return []
+
+
+def off_days_query(dates):
+	"""
+	Function to return the statement that counts each SMI's off days in every report period
+	A day counts when its value is empty, zero or below 0.1. The periods cover the same
+	latest months as the forecast and generation, and each SMI's off days in the longest
+	period are read as one range of the DAILY_READINGS key and counted for every period
+	:param dates: all dates given from Encompass files
+	:return: tuple of (periods counted, SELECT statement, payload), or None without periods
+	"""
+	periods = []
+	counts = []
+	payload = []
+	for period in perfPeriods:
+		months = get_period_values(dates, period)
+		if not months:
+			continue
+		first_day = months[0][1]*10000 + months[0][0]*100
+		last_day = months[-1][1]*10000 + months[-1][0]*100 + 99
+		periods.append(period)
+		counts.append("sum(r.day between ? and ?)")
+		payload.extend([first_day, last_day])
+	if not periods:
+		return None
+	payload.extend([min(payload[0::2]), max(payload[1::2])])
+	query = """SELECT s.SMI, """ + ", ".join(counts) + """
+			from SMI_DIM s cross join DAILY_READINGS r on r.smi_id = s.smi_id
+			where r.day between ? and ? and (r.value is null or r.value = '' or r.value < 0.1)
+			group by s.smi_id"""
+	return periods, query, payload
+
+
+def get_all_off_days(cxn, dates):
+	"""
+	Function to count the days each site had zero generation in every report period
+	:param cxn: connection to sqlite3 database
+	:param dates: all dates given from Encompass files
+	:return: dictionary of SMI to dictionary of period to number of off days
+	"""
+	built = off_days_query(dates)
+	if built is None:
+		return {}
+	periods, query, payload = built
+	result = {}
+	for row in dbselect(cxn, query, payload):
+		result[row[0]] = dict(zip(periods, row[1:]))
+	return result
 
 
-def month_gen_insert(cxn, SMI, month, year, gen):
+def build_perf_summary(cxn, SMIs, dates):
 	"""
-	Function to insert data in the sqlite table month_gen
+	Function to rebuild PERF_SUMMARY with each SMI's forecast, generation, performance,
+	off days and revenue for every report period
+	The forecast covers the period's latest months of ADJ_FORECAST and the generation
+	the period's latest months of MONTH_GEN within the last 12, as the report always has
 	:param cxn: connection to sqlite3 database
-	:param SMI: the SMI of interest
-	:param month: the month in which the generation data occurred
-	:param year: the year in which the generation data occurred
-	:param gen: the generation data after supply date adjustment
+	:param SMIs: list of all SMIs in the Encompass reports
+	:param dates: list of all (month, year) in the Encompass reports
 	:return:
 	"""
-	query = """INSERT OR IGNORE INTO MONTH_GEN(SMI, month, year, val)
-		VALUES (?,?,?,?)"""
-	payload = (SMI, month, year, gen)
-	dbexecute(cxn, query, payload)
+	fc_by_SMI = get_values_by_SMI(cxn, FORECAST_BY_SMI)
+	gen_by_SMI = get_values_by_SMI(cxn, GEN_BY_SMI)
+	tariffs = dict(dbselect(cxn, "SELECT SMI, tariff from SMI_DETAILS", None))
+	off_days = get_all_off_days(cxn, dates) if dates else {}
+
+	rows = []
+	for SMI in SMIs:
+		SMI = SMI[0]
+		tariff = None
+		if tariffs.get(SMI):
+			tariff = float(tariffs[SMI])
+		for period in perfPeriods:
+			fc = 0
+			gen = 0
+			for fc_val in get_period_values(fc_by_SMI.get(SMI, []), period):
+				if fc_val is not None:
+					fc += fc_val
+			for gen_val in get_period_values(gen_by_SMI.get(SMI, [])[-12:], period):
+				if gen_val is not None:
+					gen += gen_val
+			if (fc != 0):
+				perf = gen/fc
+			else:
+				perf = 0
+			fc_revenue = None
+			gen_revenue = None
+			shortfall = None
+			if tariff:
+				fc_revenue = (fc*tariff)/100
+				gen_revenue = (gen*tariff)/100
+				shortfall = gen_revenue - fc_revenue
+			rows.append((SMI, period, fc, gen, perf, off_days.get(SMI, {}).get(period, 0),
+				fc_revenue, gen_revenue, shortfall))
+
+	dbexecute(cxn, "DELETE FROM PERF_SUMMARY", None)
+	query = """INSERT INTO PERF_SUMMARY(SMI, period, fc, gen, perf, off_days, fc_revenue,
+			gen_revenue, shortfall) VALUES (?,?,?,?,?,?,?,?,?)"""
+	cxn.executemany(query, rows)
 
+##############################
+#                            #
+# Adjustment                 #
+#                            #
+##############################
 
-def adj_forecast_insert(cxn, SMI, month, year, adj_forecast):
+def adjust(cxn, SMIs, dates, engine, incremental, stats, forecasts=None, supply_dates=None):
 	"""
-	Function to insert data in the sqlite table adj_forecast
-	:param cxn: connection to sqlite3 database
-	:param SMI: the SMI of interest
-	:param month: the month in which the generation data occurred
-	:param year: the year in which the generation data occurred
-	:param adj_forecast: the forecast value after supply date adjustment
+	Function to build MONTH_GEN, ADJ_FORECAST and PERF_SUMMARY from the loaded data
+	:param cxn: connection to sqlite3 database with the tables created
+	:param SMIs: list of all SMIs in the Encompass reports
+	:param dates: list of all (month, year) in the Encompass reports
+	:param engine: compute ADJ_FORECAST with "sql" or "numpy"
+	:param incremental: only recompute the cells changed since the last run
+	:param stats: RunStats for the run
+	:param forecasts: list of (SMI, month, val) already read from FORECAST, if any
+	:param supply_dates: list of (SMI, supply_date) already read from SMI_DETAILS, if any
 	:return:
 	"""
-	query = """INSERT OR IGNORE INTO adj_forecast(SMI, month, year, adj_val)
-			VALUES (?,?,?,?)"""
-	payload = (SMI, month, year, adj_forecast)
-	dbexecute(cxn, query, payload)
+	# sites without a supply date keep their forecast and have no monthly generation
+	stats.list_SMIs("have no supply date so their forecasts remain the same",
+		[SMI[0] for SMI in get_unsupplied_SMIs(cxn)])
+
+	# either rebuild only what changed since the last run or every site at once
+	if incremental:
+		with stats.timer("incremental"):
+			cells = adjust_incremental(cxn, SMIs, dates)
+		stats.count("cells", cells)
+		print ("Collated monthly data and adjusted forecasts for " + str(cells) + " changed cells")
+	else:
+		print ("Collating monthly data and adjusting forecasts")
+		with stats.timer("month_gen"):
+			build_month_gen(cxn)
+		with stats.timer("adj_forecast"):
+			if engine == "numpy":
+				import forecast_engine
+				forecast_engine.adjust_forecasts(cxn, [SMI[0] for SMI in SMIs], dates,
+					solarFarms, solarFarmFactors, forecasts, supply_dates)
+			else:
+				build_adj_forecast(cxn)
+	clear_dirty(cxn)
+
+	# summarise each site's performance for the reports
+	print ("Summarising performance")
+	with stats.timer("perf_summary"):
+		build_perf_summary(cxn, SMIs, dates)
+
+	with stats.timer("commit"):
+		cxn.commit()
 
 ##############################
 #                            #
@@ -235,82 +524,26 @@ def adj_forecast_insert(cxn, SMI, month, year, adj_forecast):
 if __name__ == '__main__':
 
 	# terminate program if not executed correctly
-	if (len(sys.argv) != 1):
-		print ("Usage: python3 adjuster.py")
-		exit(1)
+	parser = argparse.ArgumentParser(description="Adjust generation and forecasts for supply dates")
+	parser.add_argument("--engine", choices=["sql", "numpy"], default="sql",
+		help="compute ADJ_FORECAST in sqlite or with NumPy arrays (default %(default)s)")
+	parser.add_argument("--incremental", action="store_true",
+		help="only recompute cells changed by ingest or Salesforce since the last run")
+	runstats.add_arguments(parser)
+	args = parser.parse_args()
 
 	# connect to the database and create the tables
 	DATABASE = "dataset.db"
 	cxn = sqlite3.connect(DATABASE)
-	create_tables(cxn)
-
-	# get all the sites of interest and dates of data
-	SMIs = get_all_SMIs(cxn)
-	dates = get_all_months(cxn)
-
-	# for each site manipulate the given data for required adjustments
-	for SMI in SMIs:
+	schema.migrate(cxn)
+	create_tables(cxn, args.incremental)
+	stats = runstats.start("adjuster", args, cxn)
 
-		print ("Collating monthly data and adjusting forecast for SMI: " + SMI[0])
-
-		supply_date = get_supply_date(cxn, SMI)
-
-		if bool(supply_date) and supply_date[0][0] != '':
-			supply_year = int(supply_date[0][0][2:4])
-			supply_month = int(supply_date[0][0][5:7])
-			supply_day = int(supply_date[0][0][8:10])
-
-			for date in dates:
-
-				month = date[0]
-				year = date[1]
-
-				adj_forecast = get_forecast(cxn, SMI[0], month)[0][0]
-
-				# logic to adjust generation/forecast based on supply date
-				if (year < supply_year):
-					month_gen = [[0]]
-					adj_forecast = 0
-				elif (supply_year == year):
-					if (month == supply_month):
-						month_gen = get_adj_month_gen(cxn, SMI, date, supply_day)
-						days_in_month = get_days_in_month(month, year)
-						adj_forecast = adj_forecast * (1-(supply_day/days_in_month))
-					elif (month < supply_month):
-						month_gen = [[0]]
-						adj_forecast = 0
-					else:
-						month_gen = create_month_gen(cxn, SMI, date)
-						adj_forecast = get_forecast(cxn, SMI[0], month)[0][0]
-				else:
-					month_gen = create_month_gen(cxn, SMI, date)
-					adj_forecast = get_forecast(cxn, SMI[0], month)[0][0]
-
-				# hardcoded solution for the solar farm sites
-				if (SMI[0]=="6203778594" or SMI[0]=="6203779394"):
-					adj_forecast = get_forecast(cxn, SMI[0], month)[0][0]
-					if year == 16:
-						adj_forecast = 0.933*adj_forecast
-					elif year == 17:
-						adj_forecast = 0.926*adj_forecast
-					elif year == 18:
-						adj_forecast = 0.919*adj_forecast
-
-				month_gen_insert(cxn, SMI[0], month, year, month_gen[0][0])
-				adj_forecast_insert(cxn, SMI[0], month, year, adj_forecast)
-		else:
-			# this handles sites that do not have a supply date populated in Salesforce
-			print (SMI[0], "does not have a supply date apparently so forecast remains the same")
-			for date in dates:
-				month = date[0]
-				year = date[1]
-				adj_forecast = get_forecast(cxn, SMI[0], month)[0][0]
-				adj_forecast_insert(cxn, SMI[0], month, year, adj_forecast)
-
-
-	cxn.commit()
+	# adjust every site, or just what changed, and summarise the performance
+	adjust(cxn, catalog.get_all_SMIs(cxn), catalog.get_all_months(cxn), args.engine, args.incremental, stats)
 	cxn.close()
 
 	print ("Complete!")
+	runstats.finish(stats, args)
 
 
@@ -5,10 +5,34 @@
 # Source code: https://github.com/con-mcleod/MonthlyPerf_Report
 # Latest Update: 10 August 2018
 
-import sys, csv, sqlite3, os, glob, re
-from collections import defaultdict
+import sys, csv, sqlite3, os, glob, re, argparse, time, itertools, hashlib
+from collections import deque
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+import schema, runstats, catalog
 
 monthList = [1,2,3,4,5,6,7,8,9,10,11,12]
+genDatatypes = ["kWh Generation", "kWh Generation Generation", "kWh Generation B1"]
+monthNums = {"Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
+			"Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12}
+
+# patterns compiled once for the header and date parsing
+smiPattern = re.compile(r'[a-zA-Z0-9]{10}')
+digitPattern = re.compile(r'\d')
+dayPattern = re.compile(r'-.*')
+monthPattern = re.compile(r'[^a-zA-Z]')
+yearPattern = re.compile(r'.*-')
+
+# rows buffered before each executemany and the sqlite settings used while loading
+BATCH_SIZE = 50000
+LOAD_PRAGMAS = {"journal_mode": "WAL", "synchronous": "OFF", "cache_size": -262144}
+DEFAULT_PRAGMAS = {"journal_mode": "DELETE", "synchronous": "FULL", "cache_size": -2000}
+
+# the dimension tables DAILY_READINGS keys its SMIs and datatypes by, with their name and id
+dimensionTables = {"SMI_DIM": ("SMI", "smi_id"), "DATATYPE_DIM": ("datatype", "datatype_id")}
+
+# the cells ingest changed, kept for the adjuster and for this run's catalog update
+dirtyTables = ["DIRTY_CELLS", "temp.CATALOG_WORK"]
 
 ##############################
 #                            #
@@ -16,26 +40,33 @@ monthList = [1,2,3,4,5,6,7,8,9,10,11,12]
 #                            #
 ##############################
 
-def create_tables(cxn):
+def create_tables(cxn, incremental=False):
 	"""
 	Function to create tables in sqlite3
 	:param cxn: the connection to the sqlite3 database
+	:param incremental: keep the existing data and manifest rather than starting over
 	:return:
 	"""
 
 	cursor = cxn.cursor()
 
-	cursor.execute("DROP TABLE IF EXISTS DAILY_GEN")
+	if not incremental:
+		cursor.execute("DROP VIEW IF EXISTS DAILY_GEN")
+		cursor.execute("DROP TABLE IF EXISTS DAILY_READINGS")
+		cursor.execute("DROP TABLE IF EXISTS SMI_DIM")
+		cursor.execute("DROP TABLE IF EXISTS DATATYPE_DIM")
+		cursor.execute("DROP TABLE IF EXISTS INGEST_MANIFEST")
+		cursor.execute("DROP TABLE IF EXISTS SMI_CATALOG")
+		cursor.execute("DROP TABLE IF EXISTS MONTH_CATALOG")
+		cursor.execute("DROP TABLE IF EXISTS CELL_CATALOG")
+		cursor.execute("DROP TABLE IF EXISTS CATALOG_STATE")
 
-	cursor.execute("""CREATE TABLE IF NOT EXISTS DAILY_GEN(
-		SMI varchar(10),
-		datatype varchar(30), 
-		obs_day int,
-		obs_month int,
-		obs_year int,
-		value float,
-		unique(SMI, obs_day, obs_month, obs_year)
-		)""")
+	# a full load indexes DAILY_READINGS once at the end, which is faster than row by row
+	for name in ["SMI_DIM", "DATATYPE_DIM", "DAILY_READINGS", "DAILY_GEN"]:
+		schema.create_table(cxn, name, indexes=incremental)
+	schema.create_table(cxn, "INGEST_MANIFEST")
+	schema.create_table(cxn, "DIRTY_CELLS")
+	catalog.create_tables(cxn)
 
 	cursor.close()
 
@@ -78,6 +109,33 @@ def dbexecute(cxn, query, payload):
 	else:
 		cursor.execute(query, payload)
 
+def dbexecutemany(cxn, query, payloads):
+	"""
+	Function to execute an sqlite3 table insertion for many rows at once
+	:param cxn: connection to the sqlite3 database
+	:param query: the query to be run
+	:param payloads: list of payloads, one per row
+	:return:
+	"""
+	cursor = cxn.cursor()
+	cursor.executemany(query, payloads)
+	cursor.close()
+
+def set_pragmas(cxn, journal_mode, synchronous, cache_size):
+	"""
+	Function to tune the sqlite3 connection for loading or normal use
+	:param cxn: connection to the sqlite3 database
+	:param journal_mode: the journal mode (e.g. WAL, DELETE, MEMORY)
+	:param synchronous: the synchronous level (OFF, NORMAL, FULL)
+	:param cache_size: the page cache size (negative values are in KiB)
+	:return:
+	"""
+	cursor = cxn.cursor()
+	cursor.execute("PRAGMA journal_mode=" + str(journal_mode))
+	cursor.execute("PRAGMA synchronous=" + str(synchronous))
+	cursor.execute("PRAGMA cache_size=" + str(int(cache_size)))
+	cursor.close()
+
 ##############################
 #                            #
 # Helper functions           #
@@ -90,50 +148,358 @@ def month_to_num(month):
 	:param month: the month as a String
 	:return: return an integer to represent the month
 	"""
-	if month == "Jan": 
-		return 1
-	elif month == "Feb":
-		return 2
-	elif month == "Mar":
-		return 3
-	elif month == "Apr":
-		return 4
-	elif month == "May":
-		return 5
-	elif month == "Jun":
-		return 6
-	elif month == "Jul":
-		return 7
-	elif month == "Aug":
-		return 8
-	elif month == "Sep":
-		return 9
-	elif month == "Oct":
-		return 10
-	elif month == "Nov":
-		return 11
-	elif month == "Dec":
-		return 12
+	return monthNums.get(month, 0)
+
+
+@lru_cache(maxsize=4096)
+def parse_date(date):
+	"""
+	Function to split an Encompass date into its day, month and year
+	Handles both the short d-Mon-yy format and the long 'Ddd dd Mon yyyy' format.
+	Every file repeats the same dates so results are memoized across rows and files
+	:param date: the date string from the first Encompass column
+	:return: tuple of (day, month, year)
+	"""
+	if (len(date) < 11):
+		day = dayPattern.sub('', date)
+		month = month_to_num(monthPattern.sub('', date))
+		year = yearPattern.sub('', date)
 	else:
-		return 0
+		day = date[4:6]
+		month = month_to_num(date[7:10])
+		year = date[13:15]
+	return day, month, year
 
 
-def daily_gen_insert(cxn, SMI, datatype, day, month, year, enc_dataset):
+def map_encompass_header(header):
+	"""
+	Function to map the Encompass header to the columns holding generation data
+	:param header: the first row of an Encompass csv
+	:return gen_cols: list of (column index, SMI, datatype) for each generation column
+	:return enc_SMIs: every SMI named in the header, in order of appearance
+	"""
+	gen_cols = []
+	enc_SMIs = []
+	for col, heading in enumerate(header):
+		SMIs = smiPattern.findall(heading)
+		datatype = heading.split("- ")[-1]
+		for SMI in SMIs:
+			if not digitPattern.search(SMI):
+				continue
+			if SMI not in enc_SMIs:
+				enc_SMIs.append(SMI)
+			if datatype in genDatatypes:
+				gen_cols.append((col, SMI, datatype))
+	return gen_cols, enc_SMIs
+
+
+def stream_encompass_rows(reader, gen_cols, counts):
+	"""
+	Function to yield DAILY_GEN rows from an Encompass csv one csv row at a time
+	so memory use does not depend on the size of the file
+	:param reader: csv reader positioned after the header row
+	:param gen_cols: the generation columns returned by map_encompass_header
+	:param counts: dictionary whose "data" entry counts the data points read
+	:return: yields (SMI, datatype, day, month, year, value) tuples
 	"""
-	Function to insert into the daily_gen table
+	for row in reader:
+		if not row:
+			continue
+		day, month, year = parse_date(row[0])
+		valid = month in monthList
+		for col, SMI, datatype in gen_cols:
+			if col >= len(row):
+				continue
+			counts["data"] += 1
+			if valid:
+				yield (SMI, datatype, day, month, year, row[col])
+
+
+def parse_encompass_file(file):
+	"""
+	Function to parse a whole Encompass file, used by the worker processes
+	:param file: path to the Encompass csv
+	:return: tuple of (generation column count, header SMIs, rows, data points read)
+	"""
+	counts = {"data": 0}
+	with open(file,'r', encoding='utf-8') as enc_in:
+		reader = csv.reader(enc_in)
+		gen_cols, enc_SMIs = map_encompass_header(next(reader, []))
+		rows = list(stream_encompass_rows(reader, gen_cols, counts))
+	return len(gen_cols), enc_SMIs, rows, counts["data"]
+
+
+def read_encompass_files(files, workers):
+	"""
+	Function to parse Encompass files either in this process or in a pool of workers
+	Results are always returned in the order of files so the single writer inserts
+	rows in the same order as a serial run and INSERT OR IGNORE keeps the same rows
+	:param files: list of Encompass csv paths
+	:param workers: number of worker processes, 1 parses and streams in this process
+	:return: yields (file, generation column count, header SMIs, rows, counts) per file
+	"""
+	if workers <= 1:
+		for file in files:
+			counts = {"data": 0}
+			with open(file,'r', encoding='utf-8') as enc_in:
+				reader = csv.reader(enc_in)
+				gen_cols, enc_SMIs = map_encompass_header(next(reader, []))
+				yield (file, len(gen_cols), enc_SMIs,
+					stream_encompass_rows(reader, gen_cols, counts), counts)
+		return
+
+	# keep a bounded number of files in flight so parsed rows don't pile up in memory
+	with ProcessPoolExecutor(max_workers=workers) as pool:
+		queued = iter(files)
+		pending = deque()
+		for file in itertools.islice(queued, 2*workers):
+			pending.append((file, pool.submit(parse_encompass_file, file)))
+		while pending:
+			file, future = pending.popleft()
+			gen_count, enc_SMIs, rows, data = future.result()
+			next_file = next(queued, None)
+			if next_file is not None:
+				pending.append((next_file, pool.submit(parse_encompass_file, next_file)))
+			yield file, gen_count, enc_SMIs, rows, {"data": data}
+
+
+def load_dimension(cxn, table):
+	"""
+	Function to load the ids of every SMI or datatype stored so far
+	:param cxn: the connection to the sqlite3 database
+	:param table: SMI_DIM or DATATYPE_DIM
+	:return: dictionary of SMI or datatype to its id
+	"""
+	name_col, id_col = dimensionTables[table]
+	return dict(dbselect(cxn, "SELECT " + name_col + ", " + id_col + " from " + table, None))
+
+
+def add_to_dimension(cxn, table, ids, name):
+	"""
+	Function to store a new SMI or datatype and return its id
+	:param cxn: the connection to the sqlite3 database
+	:param table: SMI_DIM or DATATYPE_DIM
+	:param ids: dictionary from load_dimension, the new id is added to it
+	:param name: the SMI or datatype
+	:return: the id
+	"""
+	cursor = cxn.cursor()
+	cursor.execute("INSERT INTO " + table + "(" + dimensionTables[table][0] + ") VALUES (?)",
+		(name,))
+	ids[name] = cursor.lastrowid
+	cursor.close()
+	return ids[name]
+
+
+def daily_gen_insert_many(cxn, rows):
+	"""
+	Function to insert a batch of rows into the daily readings behind the daily_gen view
 	:param cxn: the connection to the sqlite3 table
-	:param SMI: the SMI
-	:param datatype: the type of data collected - in this case it is kWh Generation
-	:param day: the day of interest
-	:param month: the month of interest
-	:param year: the year of interest
-	:param enc_dataset: the generation data from Encompass
+	:param rows: list of (smi_id, year, month, day, datatype_id, value, file_id) tuples
+	:return:
+	"""
+	query = """INSERT OR IGNORE INTO DAILY_READINGS(smi_id, day, datatype_id, value, file_id)
+		VALUES (?,?*10000 + ?*100 + ?,?,?,?)"""
+	dbexecutemany(cxn, query, rows)
+
+##############################
+#                            #
+# Ingest manifest            #
+#                            #
+##############################
+
+# a file's manifest record, bringing its size and mtime up to date when only those
+# changed, and the cells ({table}) and readings of a changed file's last ingest
+MANIFEST_SELECT = "SELECT file_id, size, mtime, hash from INGEST_MANIFEST where path=?"
+MANIFEST_TOUCH = "UPDATE INGEST_MANIFEST set size=?, mtime=? where file_id=?"
+CHANGED_FILE_CELLS = """INSERT OR IGNORE INTO {table}(SMI, month, year)
+	SELECT s.SMI, r.day/100%100, r.day/10000
+	from DAILY_READINGS r join SMI_DIM s on s.smi_id = r.smi_id where r.file_id=?"""
+CHANGED_FILE_DELETE = "DELETE FROM DAILY_READINGS where file_id=?"
+
+def file_hash(file):
+	"""
+	Function to hash the contents of an Encompass file
+	:param file: path to the Encompass csv
+	:return: the sha256 hex digest of the file
+	"""
+	digest = hashlib.sha256()
+	with open(file, 'rb') as enc_in:
+		for chunk in iter(lambda: enc_in.read(1 << 20), b''):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+
+def get_manifest_entry(cxn, path):
+	"""
+	Function to get the manifest record of a previously ingested file
+	:param cxn: connection to the sqlite3 database
+	:param path: the absolute path of the Encompass file
+	:return: tuple of (file_id, size, mtime, hash) or None if never ingested
+	"""
+	query = MANIFEST_SELECT
+	payload = (path,)
+	result = dbselect(cxn, query, payload)
+	if result:
+		return result[0]
+	return None
+
+
+def plan_ingest(cxn, files):
+	"""
+	Function to decide which Encompass files need to be parsed
+	A file is skipped when its size and mtime, or failing that its content hash,
+	match the manifest; files from an interrupted run have no manifest entry yet
+	:param cxn: connection to the sqlite3 database
+	:param files: list of Encompass csv paths
+	:return: list of (file, path, size, mtime, hash, previous file_id) to ingest
+	"""
+	plan = []
+	for file in files:
+		path = os.path.abspath(file)
+		stat = os.stat(file)
+		entry = get_manifest_entry(cxn, path)
+		if entry and entry[1] == stat.st_size and entry[2] == stat.st_mtime:
+			continue
+		digest = file_hash(file)
+		if entry and entry[3] == digest:
+			query = MANIFEST_TOUCH
+			dbexecute(cxn, query, (stat.st_size, stat.st_mtime, entry[0]))
+			continue
+		plan.append((file, path, stat.st_size, stat.st_mtime, digest, entry[0] if entry else None))
+	cxn.commit()
+	return plan
+
+
+def begin_file(cxn, path, size, mtime, digest, file_id):
+	"""
+	Function to record a file in the manifest and clear any rows from its last ingest
+	This runs in the same transaction as the file's rows so a file is either fully
+	ingested and recorded or not recorded at all
+	:param cxn: connection to the sqlite3 database
+	:param path: the absolute path of the Encompass file
+	:param size: the file size in bytes
+	:param mtime: the file modification time
+	:param digest: the content hash of the file
+	:param file_id: the file's previous id in the manifest, or None if it is new
+	:return file_id: the id to tag the file's DAILY_GEN rows with
+	"""
+	ingested_at = time.strftime('%Y.%m.%d %H:%M:%S')
+	cursor = cxn.cursor()
+	if file_id is None:
+		cursor.execute("""INSERT INTO INGEST_MANIFEST(path, size, mtime, hash, ingested_at)
+			VALUES (?,?,?,?,?)""", (path, size, mtime, digest, ingested_at))
+		file_id = cursor.lastrowid
+	else:
+		for table in dirtyTables:
+			cursor.execute(CHANGED_FILE_CELLS.format(table=table), (file_id,))
+		cursor.execute(CHANGED_FILE_DELETE, (file_id,))
+		cursor.execute("""UPDATE INGEST_MANIFEST set size=?, mtime=?, hash=?, ingested_at=?
+			where file_id=?""", (size, mtime, digest, ingested_at, file_id))
+	cursor.close()
+	return file_id
+
+
+def mark_dirty_cells(cxn, cells):
+	"""
+	Function to record the (SMI, month, year) cells touched by ingest so the
+	adjuster can recompute just those in incremental mode, and the catalog update them
+	:param cxn: connection to the sqlite3 database
+	:param cells: set of (SMI, month, year) tuples
 	:return:
 	"""
-	query = """INSERT OR IGNORE INTO DAILY_GEN(SMI, datatype, 
-		obs_day, obs_month, obs_year, value) VALUES (?,?,?,?,?,?)"""
-	payload = (SMI, datatype, day, month, year, enc_dataset)
-	dbexecute(cxn, query, payload)
+	for table in dirtyTables:
+		query = "INSERT OR IGNORE INTO " + table + "(SMI, month, year) VALUES (?,?,?)"
+		dbexecutemany(cxn, query, cells)
+
+##############################
+#                            #
+# Ingest                     #
+#                            #
+##############################
+
+def ingest_folder(cxn, enc_folder, batch_size, workers, stats):
+	"""
+	Function to ingest every new or changed Encompass file in a folder into DAILY_GEN
+	Each file is committed with its manifest entry so an interrupted run can resume
+	:param cxn: connection to the sqlite3 database with the tables created
+	:param enc_folder: the Encompass reports folder
+	:param batch_size: rows buffered per executemany
+	:param workers: number of processes parsing the files
+	:param stats: RunStats for the run
+	:return: tuple of (data points read, SMI columns, rows loaded)
+	"""
+	# variables for counting how much data is processed
+	data_count = 0
+	SMI_count = 0
+	row_total = 0
+
+	# work out which encompass files in the folder are new or have changed since the manifest
+	encompass_files = glob.glob(os.path.join(enc_folder,"*"))
+	with stats.timer("plan"):
+		plan = plan_ingest(cxn, encompass_files)
+	print ("Ingesting " + str(len(plan)) + " of " + str(len(encompass_files)) + " Encompass files")
+
+	# a first load, or a catalog left behind by an interrupted run, is rebuilt in full
+	rebuild = catalog.is_stale(cxn)
+	catalog.begin_update(cxn)
+
+	# for each of those files collect and store the data, parsing is the time not spent writing
+	parsed = read_encompass_files([entry[0] for entry in plan], workers)
+	SMI_ids = load_dimension(cxn, "SMI_DIM")
+	datatype_ids = load_dimension(cxn, "DATATYPE_DIM")
+	with stats.timer("ingest"):
+		for num, (entry, (file, gen_count, enc_SMIs, rows, counts)) in enumerate(zip(plan, parsed)):
+
+			with stats.timer("write"):
+				file_id = begin_file(cxn, *entry[1:])
+			SMI_count += gen_count
+
+			batch = []
+			touched = set()
+			for SMI, datatype, day, month, year, value in rows:
+				SMI_id = SMI_ids.get(SMI)
+				if SMI_id is None:
+					SMI_id = add_to_dimension(cxn, "SMI_DIM", SMI_ids, SMI)
+				datatype_id = datatype_ids.get(datatype)
+				if datatype_id is None:
+					datatype_id = add_to_dimension(cxn, "DATATYPE_DIM", datatype_ids, datatype)
+				batch.append((SMI_id, year, month, day, datatype_id, value, file_id))
+				touched.add((SMI, month, year))
+				if len(batch) >= batch_size:
+					with stats.timer("write"):
+						daily_gen_insert_many(cxn, batch)
+					row_total += len(batch)
+					batch = []
+
+			# write the remainder of the file and commit it with its manifest entry
+			with stats.timer("write"):
+				daily_gen_insert_many(cxn, batch)
+				mark_dirty_cells(cxn, touched)
+				cxn.commit()
+			row_total += len(batch)
+			data_count += counts["data"]
+			stats.count("files")
+			stats.progress(num+1, len(plan), "files")
+	stats.add_time("parse", stats.timers.get("ingest", 0) - stats.timers.get("write", 0))
+
+	# index the readings by file if this was a full load
+	with stats.timer("index"):
+		schema.create_indexes(cxn, "DAILY_READINGS")
+		cxn.commit()
+
+	# bring the catalog of SMIs and months up to date for the later stages, otherwise
+	# only for the cells the ingested files changed
+	with stats.timer("catalog"):
+		if rebuild:
+			catalog.rebuild_catalog(cxn)
+		elif plan:
+			catalog.update_catalog(cxn)
+		cxn.commit()
+	stats.count("rows", row_total)
+	stats.count("data_points", data_count)
+	stats.count("SMIs", SMI_count)
+	return data_count, SMI_count, row_total
 
 ##############################
 #                            #
@@ -144,70 +510,42 @@ def daily_gen_insert(cxn, SMI, datatype, day, month, year, enc_dataset):
 if __name__ == '__main__':
 
 	# terminate program if not executed correctly
-	if (len(sys.argv) != 2):
-		print ("Usage: python3 all_sitesify.py <encompass_folder>")
-		exit(1)
+	parser = argparse.ArgumentParser(description="Load Encompass reports into dataset.db")
+	parser.add_argument("encompass_folder")
+	parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+		help="rows buffered per executemany (default %(default)s)")
+	parser.add_argument("--journal-mode", default=LOAD_PRAGMAS["journal_mode"],
+		help="sqlite journal_mode while loading (default %(default)s)")
+	parser.add_argument("--synchronous", default=LOAD_PRAGMAS["synchronous"],
+		help="sqlite synchronous level while loading (default %(default)s)")
+	parser.add_argument("--cache-size", type=int, default=LOAD_PRAGMAS["cache_size"],
+		help="sqlite cache_size while loading, negative is KiB (default %(default)s)")
+	parser.add_argument("--workers", type=int, default=1,
+		help="processes used to parse Encompass files (default %(default)s)")
+	parser.add_argument("--incremental", "--resume", action="store_true",
+		help="only ingest new or changed files, resuming an interrupted run")
+	runstats.add_arguments(parser)
+	args = parser.parse_args()
 
 	# set up the locations for data retrieval and storage, connect to db and create tables
 	DATABASE = "dataset.db"
 	cxn = sqlite3.connect(DATABASE)
-	create_tables(cxn)
-	enc_folder = sys.argv[1]
-	
-	# variables for counting how much data is processed
-	data_count = 0
-	SMI_count = 0
-
-	# for each encompass file in the encompass folder collect and store the data
-	encompass_files = os.path.join(enc_folder,"*")
-	for file in glob.glob(encompass_files):
-
-		row_count = 0
-		columns = defaultdict(list)
-		enc_SMIs = []
-
-		# read each csv file by transcribing rows to columns for simpler extraction
-		with open(file,'r', encoding='utf-8') as enc_in:
-			reader = csv.reader(enc_in)
-			for row in reader:
-				for (i,v) in enumerate(row):
-					columns[i].append(v)
-				row_count += 1
-
-		# for each column extract the specific data and store into the database
-		for col in columns:
-			SMIs = re.findall(r'[a-zA-Z0-9]{10}',columns[col][0])
-			datatype = columns[col][0].split("- ")[-1]
-			enc_dataset = columns[col][1:]
-			dates = columns[0][1:]
-
-			for SMI in SMIs:
-				if bool(re.search(r'\d', SMI)) == False:
-					pass
-				else:
-					
-					if SMI not in enc_SMIs:
-						enc_SMIs.append(SMI)
-						print ("Collating daily data for SMI: " + SMI)
-					if (SMI and (datatype=="kWh Generation" or datatype=="kWh Generation Generation"
-						or datatype=="kWh Generation B1")):
-						SMI_count += 1
-						for i in range(row_count-1):
-							if (len(dates[i]) < 11):
-								day = re.sub(r'-.*', '', dates[i])
-								month = re.sub(r'[^a-zA-Z]', '', dates[i])
-								month = month_to_num(month)
-								year = re.sub(r'.*-', '', dates[i])
-							else:
-								day = dates[i][4:6]
-								month = month_to_num(dates[i][7:10])
-								year = dates[i][13:15]
-							if (month in monthList):
-								daily_gen_insert(cxn, SMI, datatype, day, month, year, enc_dataset[i])
-							data_count += 1
+	schema.migrate(cxn)
+	set_pragmas(cxn, args.journal_mode, args.synchronous, args.cache_size)
+	create_tables(cxn, args.incremental)
+	stats = runstats.start("all_sitesify", args, cxn)
 
-	cxn.commit()
+	# collect and store the data from each new or changed Encompass file
+	start = time.time()
+	data_count, SMI_count, row_total = ingest_folder(cxn, args.encompass_folder, args.batch_size,
+		args.workers, stats)
+	elapsed = time.time() - start
+	set_pragmas(cxn, DEFAULT_PRAGMAS["journal_mode"], DEFAULT_PRAGMAS["synchronous"],
+		DEFAULT_PRAGMAS["cache_size"])
 	cxn.close()
 
 	print ("Complete!")
-	print ("Collated " + str(data_count) + " data points for " + str(SMI_count) + " unique SMIs")
\ No newline at end of file
+	print ("Collated " + str(data_count) + " data points for " + str(SMI_count) + " unique SMIs")
+	print ("Loaded " + str(row_total) + " rows in " + "%.1f" % elapsed + "s ("
+		+ "%.0f" % (row_total/max(elapsed, 1e-6)) + " rows/sec)")
+	runstats.finish(stats, args)
\ No newline at end of file
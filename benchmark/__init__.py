@@ -0,0 +1,5 @@
+# Author: Connor McLeod
+# Contact: con.mcleod92@gmail.com
+# Source code: https://github.com/con-mcleod/MonthlyPerf_Report
+
+# End-to-end benchmark of the report pipeline on synthetic fleets, see benchmark/run.py
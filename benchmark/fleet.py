@@ -0,0 +1,266 @@
+#!/usr/bin/python3
+
+# Author: Connor McLeod
+# Contact: con.mcleod92@gmail.com
+# Source code: https://github.com/con-mcleod/MonthlyPerf_Report
+
+import os, csv, random, argparse
+from datetime import date, timedelta
+
+##############################
+#                            #
+# Fleet parameters           #
+#                            #
+##############################
+
+# SMI prefixes salesforcify.py maps to each site type, C&I being any site over 100kW
+smePrefixes = ["A","B","C","D","E","F","G"]
+resiPrefixes = ["W","X","Y","Z"]
+
+# share of the fleet of each site type
+siteTypeShares = [("Resi", 0.6), ("SME", 0.3), ("C&I", 0.1)]
+
+monthNames = ["January","February","March","April","May","June","July","August",
+	"September","October","November","December"]
+
+# Salesforce headings matched by salesforcify.headingPatterns
+sfHeadings = ["SMI", "Reference Number", "ECS Order", "Installer", "System Size", "Panel Brand",
+	"Address", "Postcode", "State", "PPA Status", "Installation Date", "Supply Date", "Tariff",
+	"Export Control"] + [month + " Forecast" for month in monthNames]
+
+# rows of totals and filters Salesforce adds below the report, skipped by salesforcify.py
+sfFooterRows = 6
+
+# columns of sfHeadings holding dates, written as text in a csv export
+sfDateCols = [10, 11]
+
+states = ["NSW", "VIC", "QLD", "SA", "WA", "TAS", "ACT", "NT"]
+installers = ["Acme Solar", "Sunny Installs", "Bright Energy", "Southern Cross PV", "Outback Power"]
+panelBrands = ["Jinko", "Trina", "LG", "Canadian Solar", "REC"]
+
+# excel stores dates as days since this date
+excelEpoch = date(1899, 12, 30)
+
+##############################
+#                            #
+# Fleet generation           #
+#                            #
+##############################
+
+def make_SMIs(rng, num_SMIs):
+	"""
+	Function to make unique SMIs with a site type and system size for each
+	:param rng: random.Random to draw from
+	:param num_SMIs: number of SMIs in the fleet
+	:return SMIs: list of (SMI, site type, PV size in kW)
+	"""
+	SMIs = []
+	seen = set()
+	while len(SMIs) < num_SMIs:
+		pick = rng.random()
+		for site_type, share in siteTypeShares:
+			pick -= share
+			if pick < 0:
+				break
+		if site_type == "Resi":
+			SMI = rng.choice(resiPrefixes)
+			size = round(rng.uniform(3, 10), 1)
+		elif site_type == "SME":
+			SMI = rng.choice(smePrefixes)
+			size = round(rng.uniform(10, 99), 1)
+		else:
+			SMI = rng.choice(smePrefixes + resiPrefixes)
+			size = round(rng.uniform(101, 1000), 1)
+		SMI += "%09d" % rng.randint(0, 10**9 - 1)
+		if SMI in seen:
+			continue
+		seen.add(SMI)
+		SMIs.append((SMI, site_type, size))
+	return SMIs
+
+
+def history_days(start, months):
+	"""
+	Function to list every day of a number of whole months
+	:param start: the first day of the history
+	:param months: number of months of history
+	:return days: list of dates
+	"""
+	end_month = start.month - 1 + months
+	end = date(start.year + end_month // 12, end_month % 12 + 1, 1)
+	return [start + timedelta(days=i) for i in range((end - start).days)]
+
+
+def format_date(day, long_format):
+	"""
+	Function to format a date as Encompass does
+	:param day: the date
+	:param long_format: use 'Ddd dd Mon yyyy' rather than d-Mon-yy
+	:return: the date string
+	"""
+	if long_format:
+		return day.strftime("%a %d %b %Y")
+	return str(day.day) + "-" + day.strftime("%b") + "-" + day.strftime("%y")
+
+
+def write_encompass_files(rng, folder, SMIs, days, meters_per_file):
+	"""
+	Function to write the fleet's daily generation as Encompass csv files
+	Each file holds meters_per_file meters over the whole history and the files alternate
+	between the short and long date formats. Some meters also have a consumption column
+	and some readings are blank or zero
+	:param rng: random.Random to draw from
+	:param folder: the folder to write the csv files to
+	:param SMIs: list of (SMI, site type, PV size) from make_SMIs
+	:param days: list of dates from history_days
+	:param meters_per_file: number of meters in each file
+	:return files: list of files written
+	"""
+	os.makedirs(folder, exist_ok=True)
+	files = []
+	for num, first in enumerate(range(0, len(SMIs), meters_per_file)):
+		meters = SMIs[first:first + meters_per_file]
+		header = ["Date"]
+		sizes = []
+		for SMI, site_type, size in meters:
+			header.append("NMI " + SMI + " - kWh Generation")
+			sizes.append(size)
+			if rng.random() < 0.1:
+				header.append("NMI " + SMI + " - kWh Consumption")
+				sizes.append(None)
+
+		file = os.path.join(folder, "encompass_%04d.csv" % num)
+		with open(file, "w", newline="", encoding="utf-8") as enc_out:
+			writer = csv.writer(enc_out)
+			writer.writerow(header)
+			for day in days:
+				# more sun in summer, which is the start and end of the year
+				season = 0.7 + 0.3 * abs(day.month - 6.5) / 5.5
+				row = [format_date(day, num % 2 == 1)]
+				for size in sizes:
+					pick = rng.random()
+					if pick < 0.02:
+						row.append("")
+					elif pick < 0.04:
+						row.append("0")
+					elif size is None:
+						row.append("%.2f" % (rng.random() * 30))
+					else:
+						row.append("%.2f" % (size * 4 * season * rng.uniform(0.5, 1.1)))
+				writer.writerow(row)
+		files.append(file)
+	return files
+
+
+def make_SF_rows(rng, SMIs, days, missing_supply):
+	"""
+	Function to make a Salesforce report row for each SMI
+	:param rng: random.Random to draw from
+	:param SMIs: list of (SMI, site type, PV size) from make_SMIs
+	:param days: list of dates from history_days
+	:param missing_supply: share of sites without a supply date
+	:return rows: list of rows in the order of sfHeadings
+	"""
+	rows = []
+	for num, (SMI, site_type, size) in enumerate(SMIs):
+		supply = rng.choice(days)
+		install = supply - timedelta(days=rng.randint(7, 60))
+		supply_date = (supply - excelEpoch).days
+		if rng.random() < missing_supply:
+			supply_date = ""
+		tariff = ""
+		if rng.random() < 0.9:
+			tariff = "FiT: %.2fc" % rng.uniform(8, 20)
+		forecasts = [round(size * 4 * 30 * (0.7 + 0.3 * abs(month - 6.5) / 5.5), 1)
+			for month in range(1, 13)]
+		rows.append([SMI, "REF%07d" % num, "ECS%07d" % num, rng.choice(installers), size,
+			rng.choice(panelBrands), str(rng.randint(1, 200)) + " Sample St",
+			rng.randint(800, 7999), rng.choice(states), "Active", (install - excelEpoch).days,
+			supply_date, tariff, rng.choice(["Yes ", "No"])] + forecasts)
+	return rows
+
+
+def write_SF_report(file, rows):
+	"""
+	Function to write the Salesforce report with its footer rows, as .xls, .xlsx or .csv
+	depending on the file extension. Writing .xls needs the xlwt package
+	:param file: the report file to write
+	:param rows: list of rows from make_SF_rows
+	:return:
+	"""
+	footer = [["Grand Totals (" + str(len(rows)) + " records)"]] + [[""]]*(sfFooterRows - 2) \
+		+ [["Confidential Information - Do Not Distribute"]]
+	if file.endswith(".xls"):
+		import xlwt
+		wb = xlwt.Workbook()
+		ws = wb.add_sheet("Report")
+		for row_num, row in enumerate([sfHeadings] + rows + footer):
+			for col, val in enumerate(row):
+				ws.write(row_num, col, val)
+		wb.save(file)
+	elif file.endswith(".csv"):
+		with open(file, "w", newline="", encoding="utf-8") as SF_out:
+			writer = csv.writer(SF_out)
+			writer.writerow(sfHeadings)
+			for row in rows:
+				row = list(row)
+				for col in sfDateCols:
+					if row[col] != "":
+						row[col] = (excelEpoch + timedelta(days=row[col])).strftime("%d/%m/%Y")
+				writer.writerow(row)
+			writer.writerows(footer)
+	else:
+		from openpyxl import Workbook
+		wb = Workbook(write_only=True)
+		ws = wb.create_sheet("Report")
+		for row in [sfHeadings] + rows + footer:
+			ws.append(row)
+		wb.save(file)
+
+
+def generate_fleet(folder, num_SMIs, months=24, meters_per_file=500, missing_supply=0.05,
+		sf_format="xlsx", seed=1):
+	"""
+	Function to generate a synthetic fleet: an Encompass reports folder and a Salesforce report
+	:param folder: the folder to write the fleet to
+	:param num_SMIs: number of SMIs in the fleet
+	:param months: number of months of history
+	:param meters_per_file: number of meters in each Encompass file
+	:param missing_supply: share of sites without a supply date
+	:param sf_format: xls, xlsx or csv
+	:param seed: random seed so a fleet can be generated again identically
+	:return: tuple of (Encompass folder, Salesforce report file)
+	"""
+	rng = random.Random(seed)
+	SMIs = make_SMIs(rng, num_SMIs)
+	days = history_days(date(2016, 7, 1), months)
+	enc_folder = os.path.join(folder, "encompass")
+	write_encompass_files(rng, enc_folder, SMIs, days, meters_per_file)
+	SF_file = os.path.join(folder, "salesforce." + sf_format)
+	write_SF_report(SF_file, make_SF_rows(rng, SMIs, days, missing_supply))
+	return enc_folder, SF_file
+
+##############################
+#                            #
+# GENERATE FLEET             #
+#                            #
+##############################
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description="Generate a synthetic fleet of Encompass reports "
+		+ "and a Salesforce report")
+	parser.add_argument("folder")
+	parser.add_argument("--SMIs", type=int, default=1000)
+	parser.add_argument("--months", type=int, default=24)
+	parser.add_argument("--meters-per-file", type=int, default=500)
+	parser.add_argument("--missing-supply", type=float, default=0.05,
+		help="share of sites without a supply date (default %(default)s)")
+	parser.add_argument("--sf-format", choices=["xls", "xlsx", "csv"], default="xlsx",
+		help="Salesforce report format, xls needs the xlwt package (default %(default)s)")
+	parser.add_argument("--seed", type=int, default=1)
+	args = parser.parse_args()
+
+	enc_folder, SF_file = generate_fleet(args.folder, args.SMIs, args.months, args.meters_per_file,
+		args.missing_supply, args.sf_format, args.seed)
+	print ("Written " + enc_folder + " and " + SF_file)
@@ -0,0 +1,208 @@
+#!/usr/bin/python3
+
+# Author: Connor McLeod
+# Contact: con.mcleod92@gmail.com
+# Source code: https://github.com/con-mcleod/MonthlyPerf_Report
+
+import sys, os, time, json, shlex, shutil, platform, argparse, subprocess
+from benchmark import fleet
+
+# the folder holding the pipeline scripts
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the pipeline stages in the order they run, with their arguments
+STAGES = [
+	("all_sitesify", ["all_sitesify.py", "{encompass}"]),
+	("salesforcify", ["salesforcify.py", "{salesforce}"]),
+	("adjuster", ["adjuster.py"]),
+	("genAllSites", ["genAllSites.py"]),
+	("genMonthlyReport", ["genMonthlyReport.py"]),
+]
+
+##############################
+#                            #
+# Measuring stages           #
+#                            #
+##############################
+
+def run_stage(cmd, workdir, log):
+	"""
+	Function to run a stage as a child process and measure it
+	Peak memory comes from the child's resource usage where os.wait4 is available,
+	i.e. not on Windows
+	:param cmd: the command to run
+	:param workdir: the folder holding dataset.db, the stage's working directory
+	:param log: the file the stage's output is written to
+	:return: tuple of (return code, wall time in seconds, peak RSS in KB or None)
+	"""
+	start = time.perf_counter()
+	with open(log, "w") as out:
+		proc = subprocess.Popen(cmd, cwd=workdir, stdout=out, stderr=subprocess.STDOUT)
+		if hasattr(os, "wait4"):
+			pid, status, usage = os.wait4(proc.pid, 0)
+			proc.returncode = os.waitstatus_to_exitcode(status)
+			peak_rss = usage.ru_maxrss
+			if sys.platform == "darwin":
+				peak_rss //= 1024
+		else:
+			proc.wait()
+			peak_rss = None
+	return proc.returncode, time.perf_counter() - start, peak_rss
+
+
+def get_db_size(workdir):
+	"""
+	Function to return the size of dataset.db including any write-ahead log
+	:param workdir: the folder holding dataset.db
+	:return size: size in bytes
+	"""
+	size = 0
+	for name in ["dataset.db", "dataset.db-wal"]:
+		path = os.path.join(workdir, name)
+		if os.path.exists(path):
+			size += os.path.getsize(path)
+	return size
+
+
+def run_pipeline(enc_folder, SF_file, workdir, stage_args):
+	"""
+	Function to run every stage of the pipeline on a fleet from an empty database
+	:param enc_folder: the fleet's Encompass reports folder
+	:param SF_file: the fleet's Salesforce report
+	:param workdir: the folder to run in, emptied first
+	:param stage_args: dictionary of stage name to extra arguments
+	:return stages: list of results for each stage, stopping at the first that fails
+	"""
+	shutil.rmtree(workdir, ignore_errors=True)
+	os.makedirs(workdir)
+	stages = []
+	for stage, args in STAGES:
+		cmd = [sys.executable, os.path.join(REPO, args[0])]
+		cmd += [arg.format(encompass=enc_folder, salesforce=SF_file) for arg in args[1:]]
+		cmd += stage_args.get(stage, [])
+		print ("Running " + stage)
+		returncode, wall, peak_rss = run_stage(cmd, workdir, os.path.join(workdir, stage + ".log"))
+		stages.append({"stage": stage, "wall": round(wall, 3), "peak_rss_kb": peak_rss,
+			"db_bytes": get_db_size(workdir), "returncode": returncode})
+		if returncode != 0:
+			print (stage + " failed, see " + os.path.join(workdir, stage + ".log"))
+			break
+	return stages
+
+##############################
+#                            #
+# Comparing with a baseline  #
+#                            #
+##############################
+
+def compare_results(results, baseline, tolerance):
+	"""
+	Function to find the stages that got slower, used more memory or left a larger dataset.db
+	than in a baseline
+	:param results: results of this run
+	:param baseline: results of an earlier run
+	:param tolerance: allowed increase as a fraction, e.g. 0.2 for 20%
+	:return regressions: list of messages, one per regression
+	"""
+	before = {}
+	for run in baseline["runs"]:
+		for stage in run["stages"]:
+			before[(run["SMIs"], stage["stage"])] = stage
+
+	regressions = []
+	for run in results["runs"]:
+		for stage in run["stages"]:
+			old = before.get((run["SMIs"], stage["stage"]))
+			if not old:
+				continue
+			if stage["returncode"] != 0 and old["returncode"] == 0:
+				regressions.append(str(run["SMIs"]) + " SMIs " + stage["stage"] + ": now fails")
+			for key in ["wall", "peak_rss_kb", "db_bytes"]:
+				if stage[key] is None or not old[key]:
+					continue
+				if stage[key] > old[key] * (1 + tolerance):
+					regressions.append(str(run["SMIs"]) + " SMIs " + stage["stage"] + ": " + key
+						+ " " + str(old[key]) + " -> " + str(stage[key]))
+	return regressions
+
+
+def print_results(results):
+	"""
+	Function to print a table of the results
+	:param results: results of this run
+	:return:
+	"""
+	print ("%8s %-18s %10s %12s %14s" % ("SMIs", "stage", "wall s", "peak RSS MB", "dataset.db MB"))
+	for run in results["runs"]:
+		for stage in run["stages"]:
+			peak_rss = "-"
+			if stage["peak_rss_kb"] is not None:
+				peak_rss = "%.1f" % (stage["peak_rss_kb"] / 1024)
+			print ("%8d %-18s %10.2f %12s %14.1f" % (run["SMIs"], stage["stage"], stage["wall"],
+				peak_rss, stage["db_bytes"] / 1024 / 1024))
+
+##############################
+#                            #
+# RUN BENCHMARK              #
+#                            #
+##############################
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description="Time every pipeline stage on synthetic fleets")
+	parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000],
+		help="fleet sizes in SMIs (default %(default)s)")
+	parser.add_argument("--months", type=int, default=24)
+	parser.add_argument("--meters-per-file", type=int, default=500)
+	parser.add_argument("--missing-supply", type=float, default=0.05)
+	parser.add_argument("--sf-format", choices=["xls", "xlsx", "csv"], default="xlsx",
+		help="Salesforce report format, xls needs the xlwt package (default %(default)s)")
+	parser.add_argument("--seed", type=int, default=1)
+	parser.add_argument("--workdir", default="bench_work",
+		help="folder for the generated fleets, which are reused, and the runs")
+	parser.add_argument("--stage-args", action="append", default=[], metavar="STAGE=ARGS",
+		help="extra arguments for a stage, e.g. all_sitesify='--workers 4'")
+	parser.add_argument("--output", default="bench_results.json")
+	parser.add_argument("--baseline", help="results of an earlier run to compare against")
+	parser.add_argument("--tolerance", type=float, default=0.2,
+		help="allowed slowdown, memory or dataset.db growth over the baseline (default %(default)s)")
+	args = parser.parse_args()
+
+	stage_args = {}
+	for stage_arg in args.stage_args:
+		stage, extra = stage_arg.split("=", 1)
+		stage_args[stage] = shlex.split(extra)
+
+	results = {"python": platform.python_version(), "platform": platform.platform(),
+		"months": args.months, "meters_per_file": args.meters_per_file,
+		"stage_args": stage_args, "runs": []}
+
+	for size in args.sizes:
+		# generate each fleet once and reuse it for later runs
+		fleet_dir = os.path.join(args.workdir, "fleet_%d_%d_%d_%d" % (size, args.months,
+			args.meters_per_file, args.seed))
+		enc_folder = os.path.join(fleet_dir, "encompass")
+		SF_file = os.path.join(fleet_dir, "salesforce." + args.sf_format)
+		if not os.path.exists(SF_file):
+			print ("Generating fleet of " + str(size) + " SMIs")
+			fleet.generate_fleet(fleet_dir, size, args.months, args.meters_per_file,
+				args.missing_supply, args.sf_format, args.seed)
+
+		stages = run_pipeline(os.path.abspath(enc_folder), os.path.abspath(SF_file),
+			os.path.join(args.workdir, "run_%d" % size), stage_args)
+		results["runs"].append({"SMIs": size, "stages": stages,
+			"total_wall": round(sum([stage["wall"] for stage in stages]), 3)})
+
+	with open(args.output, "w") as f:
+		json.dump(results, f, indent=2)
+	print_results(results)
+	print ("Written " + args.output)
+
+	if args.baseline:
+		with open(args.baseline) as f:
+			regressions = compare_results(results, json.load(f), args.tolerance)
+		for regression in regressions:
+			print ("Regression: " + regression)
+		if regressions:
+			exit(1)
+		print ("No regressions against " + args.baseline)
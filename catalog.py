@@ -0,0 +1,229 @@
+#!/usr/bin/python3
+
+# Author: Connor McLeod
+# Contact: con.mcleod92@gmail.com
+# Source code: https://github.com/con-mcleod/MonthlyPerf_Report
+
+import sqlite3, time, argparse
+import schema
+
+##############################
+#                            #
+# Building the catalog       #
+#                            #
+##############################
+
+# sums each SMI's or month's cells into SMI_CATALOG or MONTH_CATALOG, {cells} limits the
+# cells to those of the SMIs or months being brought up to date; dates are compared as
+# YYMMDD numbers to find each SMI's first and last reading
+SMI_CATALOG_INSERT = """INSERT INTO SMI_CATALOG(SMI, first_year, first_month, first_day,
+		last_year, last_month, last_day, readings)
+	SELECT SMI, first/10000, first/100%100, first%100, last/10000, last/100%100, last%100,
+		readings
+	from (SELECT SMI, min(obs_year*10000 + obs_month*100 + first_day) as first,
+			max(obs_year*10000 + obs_month*100 + last_day) as last, sum(readings) as readings
+		from CELL_CATALOG {cells} group by SMI)"""
+
+MONTH_CATALOG_INSERT = """INSERT INTO MONTH_CATALOG(obs_month, obs_year, first_day, last_day,
+		SMIs, readings)
+	SELECT obs_month, obs_year, min(first_day), max(last_day), count(*), sum(readings)
+	from CELL_CATALOG {cells} group by obs_year, obs_month"""
+
+# every cell's readings, read with one scan of DAILY_GEN
+CELL_CATALOG_INSERT = """INSERT INTO CELL_CATALOG(SMI, obs_year, obs_month, first_day,
+		last_day, readings)
+	SELECT SMI, obs_year, obs_month, min(obs_day), max(obs_day), count(*)
+	from DAILY_GEN group by SMI, obs_year, obs_month"""
+
+# the changed cells' readings, each cell read as one range of the DAILY_READINGS key
+CELL_CATALOG_UPDATE = """INSERT INTO CELL_CATALOG(SMI, obs_year, obs_month, first_day,
+		last_day, readings)
+	SELECT c.SMI, c.year, c.month, min(r.day)%100, max(r.day)%100, count(*)
+	from temp.CATALOG_WORK c join SMI_DIM s on s.SMI = c.SMI
+	join DAILY_READINGS r on r.smi_id = s.smi_id
+		and r.day between c.year*10000 + c.month*100 and c.year*10000 + c.month*100 + 99
+	group by c.SMI, c.year, c.month"""
+
+# the changed cells and the SMIs and months they belong to
+dirtyCells = "where (SMI, obs_year, obs_month) in (SELECT SMI, year, month from temp.CATALOG_WORK)"
+dirtySMIs = "where SMI in (SELECT SMI from temp.CATALOG_WORK)"
+dirtyMonths = "where (obs_year, obs_month) in (SELECT year, month from temp.CATALOG_WORK)"
+
+
+def create_tables(cxn):
+	"""
+	Function to create the catalog tables
+	:param cxn: connection to the sqlite3 database
+	:return:
+	"""
+	schema.create_table(cxn, "CELL_CATALOG")
+	schema.create_table(cxn, "SMI_CATALOG")
+	schema.create_table(cxn, "MONTH_CATALOG")
+	schema.create_table(cxn, "CATALOG_STATE")
+
+
+def mark_built(cxn):
+	"""
+	Function to record that the catalog is up to date with the ingested files
+	:param cxn: connection to the sqlite3 database
+	:return:
+	"""
+	cxn.execute("DELETE FROM CATALOG_STATE")
+	cxn.execute("INSERT INTO CATALOG_STATE(built_at) VALUES (?)",
+		(time.strftime('%Y.%m.%d %H:%M:%S'),))
+
+
+def rebuild_catalog(cxn):
+	"""
+	Function to rebuild the catalog of what DAILY_GEN holds with one scan of it
+	DAILY_GEN is summarised per SMI and month first, and both catalog tables are
+	built from that much smaller table
+	:param cxn: connection to the sqlite3 database
+	:return:
+	"""
+	cursor = cxn.cursor()
+	create_tables(cxn)
+	cursor.execute("DELETE FROM CELL_CATALOG")
+	cursor.execute(CELL_CATALOG_INSERT)
+
+	cursor.execute("DELETE FROM SMI_CATALOG")
+	cursor.execute(SMI_CATALOG_INSERT.format(cells=""))
+	cursor.execute("DELETE FROM MONTH_CATALOG")
+	cursor.execute(MONTH_CATALOG_INSERT.format(cells=""))
+	mark_built(cxn)
+	cursor.close()
+
+
+def begin_update(cxn):
+	"""
+	Function to start collecting the cells an ingest changes in temp.CATALOG_WORK, which
+	has the definition of DIRTY_CELLS but only lasts the run, as DIRTY_CELLS is kept until
+	the adjuster runs. A run interrupted before update_catalog leaves the catalog stale
+	:param cxn: connection to the sqlite3 database
+	:return:
+	"""
+	cxn.execute("DROP TABLE IF EXISTS temp.CATALOG_WORK")
+	schema.create_table(cxn, "DIRTY_CELLS", table="temp.CATALOG_WORK")
+
+
+def update_catalog(cxn):
+	"""
+	Function to bring the catalog up to date for the cells in temp.CATALOG_WORK only
+	Each changed cell is summed again from DAILY_READINGS, then the SMIs and months
+	it belongs to from CELL_CATALOG, so the work follows the changed data rather than
+	the history. This relies on is_stale being False when begin_update was called
+	:param cxn: connection to the sqlite3 database
+	:return:
+	"""
+	cursor = cxn.cursor()
+	cursor.execute("DELETE FROM CELL_CATALOG " + dirtyCells)
+	cursor.execute(CELL_CATALOG_UPDATE)
+	cursor.execute("DELETE FROM SMI_CATALOG " + dirtySMIs)
+	cursor.execute(SMI_CATALOG_INSERT.format(cells=dirtySMIs))
+	cursor.execute("DELETE FROM MONTH_CATALOG " + dirtyMonths)
+	cursor.execute(MONTH_CATALOG_INSERT.format(cells=dirtyMonths))
+	cursor.execute("DROP TABLE temp.CATALOG_WORK")
+	mark_built(cxn)
+	cursor.close()
+
+
+def is_stale(cxn):
+	"""
+	Function to check whether the catalog needs rebuilding before it is read, i.e. it is
+	empty or a file was ingested after it was built, as when a run is interrupted
+	between committing its last file and committing the catalog
+	:param cxn: connection to the sqlite3 database with the ingest tables created
+	:return: True if the catalog should be rebuilt rather than updated
+	"""
+	built = cxn.execute("SELECT built_at from CATALOG_STATE").fetchone()
+	if built is None or cxn.execute("SELECT 1 from MONTH_CATALOG limit 1").fetchone() is None:
+		return True
+	ingested = cxn.execute("SELECT max(ingested_at) from INGEST_MANIFEST").fetchone()[0]
+	return ingested is not None and ingested > built[0]
+
+##############################
+#                            #
+# Reading the catalog        #
+#                            #
+##############################
+
+def get_all_SMIs(cxn):
+	"""
+	Function to grab all SMIs from the Encompass reports
+	:param cxn: connection to sqlite3 database
+	:return all_SMIs: list of all SMIs
+	"""
+	query = "SELECT SMI from SMI_CATALOG order by SMI"
+	return cxn.execute(query).fetchall()
+
+
+def get_all_months(cxn):
+	"""
+	Function to return all months included in the Encompass reports
+	:param cxn: connection to sqlite3 database
+	:return all_dates: list of all months in report [mm, yy]
+	"""
+	query = "SELECT obs_month, obs_year from MONTH_CATALOG order by obs_year, obs_month"
+	return cxn.execute(query).fetchall()
+
+
+def get_first_date(cxn):
+	"""
+	Function to return the date of the first data entry from Encompass reports
+	:param cxn: connection to sqlite3 database
+	:return: first date of Encompass reports as (dd, mm, yy), or None if there is none
+	"""
+	query = """SELECT first_day, obs_month, obs_year from MONTH_CATALOG
+			order by obs_year, obs_month limit 1"""
+	return cxn.execute(query).fetchone()
+
+
+def get_last_date(cxn):
+	"""
+	Function to return the date of the last data entry from Encompass reports
+	:param cxn: connection to sqlite3 database
+	:return: last date of Encompass reports as (dd, mm, yy), or None if there is none
+	"""
+	query = """SELECT last_day, obs_month, obs_year from MONTH_CATALOG
+			order by obs_year desc, obs_month desc limit 1"""
+	return cxn.execute(query).fetchone()
+
+
+def get_SMI_readings(cxn):
+	"""
+	Function to return each SMI's first and last reading and how many readings it has
+	:param cxn: connection to sqlite3 database
+	:return: dictionary of SMI to ((dd, mm, yy) first, (dd, mm, yy) last, readings)
+	"""
+	query = """SELECT SMI, first_day, first_month, first_year, last_day, last_month, last_year,
+			readings from SMI_CATALOG"""
+	return dict([(row[0], (row[1:4], row[4:7], row[7])) for row in cxn.execute(query)])
+
+##############################
+#                            #
+# PRINT CATALOG              #
+#                            #
+##############################
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description="Print what dataset.db holds, rebuilding "
+		+ "the catalog from DAILY_GEN if asked")
+	parser.add_argument("--database", default="dataset.db")
+	parser.add_argument("--rebuild", action="store_true",
+		help="rebuild the catalog from DAILY_GEN first")
+	args = parser.parse_args()
+
+	cxn = sqlite3.connect(args.database)
+	schema.migrate(cxn)
+	if args.rebuild:
+		rebuild_catalog(cxn)
+		cxn.commit()
+
+	months = get_all_months(cxn)
+	if not months:
+		exit("No Encompass data in " + args.database)
+	print (str(len(get_all_SMIs(cxn))) + " SMIs")
+	print (str(len(months)) + " months from " + ".".join(map(str, get_first_date(cxn)))
+		+ " to " + ".".join(map(str, get_last_date(cxn))))
+	cxn.close()
@@ -0,0 +1,159 @@
+#!/usr/bin/python3
+
+# Author: Connor McLeod
+# Contact: con.mcleod92@gmail.com
+# Source code: https://github.com/con-mcleod/MonthlyPerf_Report
+
+import numpy as np
+
+##############################
+#                            #
+# Loading arrays             #
+#                            #
+##############################
+
+def load_forecast_matrix(cxn, SMIs, forecasts=None):
+	"""
+	Function to load the Salesforce forecasts into an SMI x month array
+	:param cxn: connection to sqlite3 database
+	:param SMIs: list of SMIs giving the row order
+	:param forecasts: list of (SMI, month, val) already read from FORECAST, if any
+	:return forecast: (len(SMIs), 12) float array, NaN where there is no forecast
+	"""
+	if forecasts is None:
+		forecasts = cxn.execute("SELECT SMI, month, val from FORECAST")
+	index = {SMI: i for i, SMI in enumerate(SMIs)}
+	forecast = np.full((len(SMIs), 12), np.nan)
+	for SMI, month, val in forecasts:
+		row = index.get(SMI)
+		if row is not None and month in range(1, 13) and val is not None:
+			forecast[row, month-1] = val
+	return forecast
+
+
+def load_supply_arrays(cxn, SMIs, supply_dates=None):
+	"""
+	Function to load the supply dates into year, month and day arrays
+	The 'YYYY.MM.DD' supply date is sliced the same way the adjuster always has
+	:param cxn: connection to sqlite3 database
+	:param SMIs: list of SMIs giving the row order
+	:param supply_dates: list of (SMI, supply_date) already read from SMI_DETAILS, if any
+	:return: tuple of (has_supply, supply_year, supply_month, supply_day) arrays
+	"""
+	if supply_dates is None:
+		supply_dates = cxn.execute("SELECT SMI, supply_date from SMI_DETAILS")
+	index = {SMI: i for i, SMI in enumerate(SMIs)}
+	has_supply = np.zeros(len(SMIs), dtype=bool)
+	supply = np.zeros((3, len(SMIs)), dtype=np.int64)
+	for SMI, supply_date in supply_dates:
+		row = index.get(SMI)
+		if row is None or not supply_date:
+			continue
+		has_supply[row] = True
+		supply[:, row] = (int(supply_date[2:4]), int(supply_date[5:7]), int(supply_date[8:10]))
+	return has_supply, supply[0], supply[1], supply[2]
+
+
+def month_index(dates):
+	"""
+	Function to split the report months into month and year arrays
+	:param dates: list of (month, year) in report order
+	:return: tuple of (months, years) int arrays
+	"""
+	months = np.array([date[0] for date in dates], dtype=np.int64)
+	years = np.array([date[1] for date in dates], dtype=np.int64)
+	return months, years
+
+##############################
+#                            #
+# Adjustment                 #
+#                            #
+##############################
+
+def days_in_months(months, years):
+	"""
+	Function to return the number of days in each month, as DAYS_IN_MONTH in adjuster.py does
+	:param months: int array of months
+	:param years: int array of two digit years
+	:return: int array of days in each month
+	"""
+	days = np.full(months.shape, 28, dtype=np.int64)
+	days[np.isin(years, [16, 20, 24, 28])] = 29
+	days[np.isin(months, [4, 6, 9, 11])] = 30
+	days[np.isin(months, [1, 3, 5, 7, 8, 10, 12])] = 31
+	return days
+
+
+def compute_adj_forecast(forecast, months, years, has_supply, supply_year, supply_month,
+		supply_day, solar, factors):
+	"""
+	Function to compute the adjusted forecast for every SMI and month at once
+	Applies the same rules as the adjuster: zero before the supply month, pro-rated
+	in the supply month, unchanged without a supply date, and the solar farms scaled
+	by their degradation factor for the year
+	:param forecast: (SMIs, 12) forecast array from load_forecast_matrix
+	:param months: month of each report month from month_index
+	:param years: year of each report month from month_index
+	:param has_supply: bool array of SMIs with a supply date
+	:param supply_year: two digit supply year of each SMI
+	:param supply_month: supply month of each SMI
+	:param supply_day: supply day of each SMI
+	:param solar: bool array of the solar farm SMIs
+	:param factors: dictionary of year to solar farm degradation factor
+	:return adj: (SMIs, months) float array, NaN where there is no forecast
+	"""
+	fc = forecast[:, months-1]
+	year = years[np.newaxis, :]
+	month = months[np.newaxis, :]
+	sy = supply_year[:, np.newaxis]
+	sm = supply_month[:, np.newaxis]
+	sd = supply_day[:, np.newaxis]
+
+	before = (year < sy) | ((year == sy) & (month < sm))
+	in_supply_month = (year == sy) & (month == sm)
+	pro_rated = fc * (1 - (sd / days_in_months(months, years)[np.newaxis, :]))
+	adj = np.where(before, 0.0, np.where(in_supply_month, pro_rated, fc))
+
+	factor = np.array([factors.get(int(y), np.nan) for y in years])
+	solar_fc = np.where(np.isnan(factor)[np.newaxis, :], fc, factor[np.newaxis, :] * fc)
+	adj = np.where((solar & has_supply)[:, np.newaxis], solar_fc, adj)
+	adj = np.where(has_supply[:, np.newaxis], adj, fc)
+	return adj
+
+
+def write_adj_forecast(cxn, SMIs, dates, adj):
+	"""
+	Function to write the adjusted forecast matrix to ADJ_FORECAST in one bulk insert
+	:param cxn: connection to sqlite3 database
+	:param SMIs: list of SMIs giving the row order
+	:param dates: list of (month, year) giving the column order
+	:param adj: (SMIs, months) array from compute_adj_forecast
+	:return:
+	"""
+	values = adj.tolist()
+	rows = ((SMI, date[0], date[1], None if val != val else val)
+		for SMI, row in zip(SMIs, values) for date, val in zip(dates, row))
+	query = """INSERT OR IGNORE INTO ADJ_FORECAST(SMI, month, year, adj_val)
+			VALUES (?,?,?,?)"""
+	cxn.executemany(query, rows)
+
+
+def adjust_forecasts(cxn, SMIs, dates, solar_farms, factors, forecasts=None, supply_dates=None):
+	"""
+	Function to rebuild the whole ADJ_FORECAST table from arrays
+	:param cxn: connection to sqlite3 database
+	:param SMIs: list of SMIs in the Encompass reports
+	:param dates: list of (month, year) in the Encompass reports
+	:param solar_farms: list of solar farm SMIs
+	:param factors: dictionary of year to solar farm degradation factor
+	:param forecasts: list of (SMI, month, val) already read from FORECAST, if any
+	:param supply_dates: list of (SMI, supply_date) already read from SMI_DETAILS, if any
+	:return:
+	"""
+	forecast = load_forecast_matrix(cxn, SMIs, forecasts)
+	has_supply, supply_year, supply_month, supply_day = load_supply_arrays(cxn, SMIs, supply_dates)
+	months, years = month_index(dates)
+	solar = np.isin(np.array(SMIs, dtype=object), solar_farms)
+	adj = compute_adj_forecast(forecast, months, years, has_supply, supply_year,
+		supply_month, supply_day, solar, factors)
+	write_adj_forecast(cxn, SMIs, dates, adj)
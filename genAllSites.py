@@ -5,9 +5,16 @@
 # Source code: https://github.com/con-mcleod/MonthlyPerf_Report
 # Latest Update: 10 August 2018
 
-import sys, sqlite3, os
+import sys, sqlite3, os, argparse
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Color, Font, PatternFill, Border, Side
+import schema, runstats, catalog
+import report_outputs
+
+# openpyxl format styles
+leftBorder = Border(left=Side(style='thin'))
+rightBorder = Border(right=Side(style='thin'))
 
 ##############################
 #                            #
@@ -40,84 +47,132 @@ def dbselect(cxn, query, payload):
 #                            #
 ##############################
 
-def get_all_SMIs(cxn):
+def load_month_gen_matrix(cxn, SMIs, dates):
 	"""
-	Function to grab all SMIs from the Encompass reports
+	Function to load the whole MONTH_GEN table as an SMI x month matrix in one query
 	:param cxn: connection to sqlite3 database
-	:return all_SMIs: list of all SMIs
+	:param SMIs: list of all SMIs, giving the row order
+	:param dates: list of all months in the report, giving the column order
+	:return matrix: one list per SMI with the generation for each month, None if missing
 	"""
-	query = "SELECT distinct(SMI) from DAILY_GEN"
+	SMI_index = {}
+	for i, SMI in enumerate(SMIs):
+		SMI_index[SMI[0]] = i
+	date_index = {}
+	for j, date in enumerate(dates):
+		date_index[(date[0], date[1])] = j
+
+	matrix = [[None]*len(dates) for SMI in SMIs]
+	query = "SELECT SMI, month, year, val from MONTH_GEN"
 	payload = None
-	all_SMIs = dbselect(cxn, query, payload)
-	return all_SMIs
+	for SMI, month, year, val in dbselect(cxn, query, payload):
+		i = SMI_index.get(SMI)
+		j = date_index.get((month, year))
+		if i is not None and j is not None:
+			matrix[i][j] = val
+	return matrix
+
+
+# each SMI's off days in the current month
+OFF_DAYS_SELECT = "SELECT SMI, off_days from PERF_SUMMARY where period='Month'"
 
 
-def get_all_months(cxn):
+def load_off_days(cxn, SMIs):
 	"""
-	Function to return all months included in the Encompass reports
+	Function to read the days each site had zero generation in the current month
+	from PERF_SUMMARY, where adjuster.py counts them
 	:param cxn: connection to sqlite3 database
-	:return all_dates: list of all months in report [mm, yy]
+	:param SMIs: list of all SMIs, giving the order of the result
+	:return: list with the number of off days for each SMI
 	"""
-	query = """SELECT obs_month, obs_year from DAILY_GEN 
-			group by obs_month, obs_year order by obs_year, obs_month"""
+	query = OFF_DAYS_SELECT
 	payload = None
-	all_dates = dbselect(cxn, query, payload)
-	return all_dates
+	off_days = dict(dbselect(cxn, query, payload))
+	return [off_days.get(SMI[0], 0) for SMI in SMIs]
 
+##############################
+#                            #
+# Streaming output           #
+#                            #
+##############################
 
-def get_last_date(cxn):
+def get_headings(dates):
 	"""
-	Function to return the date of the last data entry from Encompass reports
-	:param cxn: connection to sqlite3 database
-	:return last_date: last date of Encompass reports
+	Function to return the All_sites column headings
+	:param dates: list of all months in the report
+	:return headings: list of headings
 	"""
-	query = """SELECT obs_day, obs_month, obs_year from DAILY_GEN
-			group by obs_day, obs_month, obs_year order by obs_year, obs_month, obs_day"""
-	payload = None
-	all_dates = dbselect(cxn, query, payload)
-	last_date = all_dates[-1]
-	return last_date
+	headings = ["SMI"]
+	for date in dates:
+		headings.append(str(date[0]) + "," + str(date[1]))
+	headings.append("Outage Days")
+	return headings
 
 
-def get_month_gen(cxn, SMI, date):
+def get_rows(SMIs, month_gen, off_days):
 	"""
-	Function to return the monthly generation for an SMI in a given month
-	:param cxn: connection to sqlite3 database
-	:param SMI: the SMI of interest
-	:param date: the month and year of interest
-	:return result: the monthly generation
+	Function to yield the All_sites rows as plain values for the non-Excel formats
+	:param SMIs: list of all SMIs
+	:param month_gen: SMI x month generation matrix from load_month_gen_matrix
+	:param off_days: off days for each SMI from load_off_days
+	:return: generator of rows matching get_headings
 	"""
-	month = date[0]
-	year = date[1]
-	query = "SELECT val from MONTH_GEN where SMI=? and month=? and year=?"
-	payload = (SMI, month, year)
-	gen = dbselect(cxn, query, payload)
-	return gen
+	for i, SMI in enumerate(SMIs):
+		yield [SMI[0]] + month_gen[i] + [off_days[i]]
 
 
-def get_off_days(cxn, SMI, dates):
+def styled_cell(ws, value, border):
 	"""
-	Function to return the number of days a site had zero generation in a given month
-	:param cxn: connection to sqlite3 database
-	:param SMI: the SMI of interest
-	:param dates: all dates given from Encompass files
-	:return off_days: number of days of zero generation in the current month for an SMI
-	"""
-	curr_date = dates[-1]
-	curr_month = curr_date[0]
-	curr_year = curr_date[1]
-	off_days = 0
-	query = """SELECT value from DAILY_GEN where SMI=? and obs_month=? 
-				and obs_year=?"""
-	payload = (SMI[0], curr_month, curr_year)
-	result = dbselect(cxn, query, payload)
-	if result:
-		for val in result:
-			if not val[0]:
-				off_days += 1
-			elif val[0] < 0.1:
-				off_days += 1
-	return off_days
+	Function to create a cell for a write-only worksheet with a border
+	:param ws: the write-only worksheet
+	:param value: the cell value
+	:param border: the openpyxl border for the cell
+	:return cell: the write-only cell
+	"""
+	cell = WriteOnlyCell(ws, value=value)
+	cell.border = border
+	return cell
+
+
+def write_all_sites_sheet(wb, SMIs, dates, month_gen, off_days, stats=None):
+	"""
+	Function to write the All_sites sheet a whole row at a time to a write-only workbook
+	so memory stays flat however many SMIs there are
+	:param wb: the write-only workbook
+	:param SMIs: list of all SMIs
+	:param dates: list of all months in the report
+	:param month_gen: SMI x month generation matrix from load_month_gen_matrix
+	:param off_days: off days for each SMI from load_off_days
+	:param stats: RunStats to count the cells written and show progress on, if any
+	:return:
+	"""
+	ws = wb.create_sheet("All_sites")
+	ws.append(get_headings(dates))
+
+	for i, SMI in enumerate(SMIs):
+		row = [styled_cell(ws, SMI[0], rightBorder)]
+		row.extend(month_gen[i])
+		row.append(styled_cell(ws, off_days[i], leftBorder))
+		ws.append(row)
+		if stats:
+			stats.count("cells", len(row))
+			stats.progress(i+1, len(SMIs))
+
+
+def write_all_sites_streaming(output, SMIs, dates, month_gen, off_days, stats=None):
+	"""
+	Function to write the All_sites sheet on its own to a write-only workbook
+	:param output: the xlsx file to write
+	:param SMIs: list of all SMIs
+	:param dates: list of all months in the report
+	:param month_gen: SMI x month generation matrix from load_month_gen_matrix
+	:param off_days: off days for each SMI from load_off_days
+	:param stats: RunStats to count the cells written and show progress on, if any
+	:return:
+	"""
+	wb = Workbook(write_only=True)
+	write_all_sites_sheet(wb, SMIs, dates, month_gen, off_days, stats)
+	wb.save(output)
 
 ##############################
 #                            #
@@ -128,55 +183,72 @@ def get_off_days(cxn, SMI, dates):
 if __name__ == '__main__':
 
 	# terminate program if not executed correctly
-	if (len(sys.argv) != 1):
-		print ("Usage: python3 genAllSites.py")
-		exit(1)
+	parser = argparse.ArgumentParser(description="Generate the All_sites sheet of the monthly report")
+	parser.add_argument("--streaming", action="store_true",
+		help="write rows straight to a write-only workbook to keep memory constant")
+	parser.add_argument("--format", choices=["xlsx"] + sorted(report_outputs.OUTPUT_FORMATS),
+		default="xlsx", help="write the sheet as Excel or as a plain data file (default %(default)s)")
+	runstats.add_arguments(parser)
+	args = parser.parse_args()
 
 	# connect to the database and create the tables
 	DATABASE = "dataset.db"
 	cxn = sqlite3.connect(DATABASE)
+	schema.migrate(cxn)
+	stats = runstats.start("genAllSites", args, cxn)
 
 	# name the output file using YY.MM.DD.xlsx format
-	last_date = get_last_date(cxn)
-	output = str(last_date[2])+"."+str(last_date[1])+"."+str(last_date[0]) + ".xlsx"
+	last_date = catalog.get_last_date(cxn)
+	report = str(last_date[2])+"."+str(last_date[1])+"."+str(last_date[0])
+	output = report + ".xlsx"
 
-	if (os.path.exists(output)):
+	if (args.format == "xlsx" and os.path.exists(output)):
 		os.remove(output)
 
-	# openpyxl commands to create excel workbook and sheets
-	wb = Workbook()
-	ws = wb.active
-	ws.title = "All_sites"
-
-	# openpyxl format styles
-	leftBorder = Border(left=Side(style='thin'))
-	rightBorder = Border(right=Side(style='thin'))
-
-	dates = get_all_months(cxn)
-	SMIs = get_all_SMIs(cxn)
-
-	# for each SMI format and store the data in the sheet
-	row_count = 1
-	for SMI in SMIs:
-		col_count = 1
-		ws.cell(row=1, column=1).value = "SMI"
-		ws.cell(row=row_count+1, column=1).value = SMI[0]
-		ws.cell(row=row_count+1, column=1).border = rightBorder
-
-		print("Formatting SMI: " + SMI[0])
-
-		for date in dates:
-			ws.cell(row=1, column=col_count+1).value = str(date[0]) + "," + str(date[1])
-			month_gen = get_month_gen(cxn, SMI[0], date)
-			if month_gen:
-				ws.cell(row=row_count+1, column=col_count+1).value = month_gen[0][0]
-			col_count += 1
-		ws.cell(row=1, column=col_count+1).value = "Outage Days"
-		off_days = get_off_days(cxn, SMI, dates)
-		ws.cell(row=row_count+1, column=col_count+1).border = leftBorder
-		ws.cell(row=row_count+1, column=col_count+1).value = off_days
-		row_count += 1
-
-	wb.save(output)	
-
-	print ("Complete!")
\ No newline at end of file
+	# load the whole SMI x month matrix and the outage counts up front
+	with stats.timer("query"):
+		dates = catalog.get_all_months(cxn)
+		SMIs = catalog.get_all_SMIs(cxn)
+		month_gen = load_month_gen_matrix(cxn, SMIs, dates)
+		off_days = load_off_days(cxn, SMIs)
+
+	stats.begin("write")
+	if args.format != "xlsx":
+		output = report_outputs.output_path(report, "All_sites", args.format)
+		report_outputs.write_rows(args.format, output, get_headings(dates),
+			get_rows(SMIs, month_gen, off_days))
+		stats.count("cells", len(SMIs) * (len(dates) + 2))
+		print ("Written " + output)
+	elif args.streaming:
+		write_all_sites_streaming(output, SMIs, dates, month_gen, off_days, stats)
+	else:
+		# openpyxl commands to create excel workbook and sheets
+		wb = Workbook()
+		ws = wb.active
+		ws.title = "All_sites"
+
+		# for each SMI format and store the data in the sheet
+		row_count = 1
+		for i, SMI in enumerate(SMIs):
+			col_count = 1
+			ws.cell(row=1, column=1).value = "SMI"
+			ws.cell(row=row_count+1, column=1).value = SMI[0]
+			ws.cell(row=row_count+1, column=1).border = rightBorder
+
+			for date in dates:
+				ws.cell(row=1, column=col_count+1).value = str(date[0]) + "," + str(date[1])
+				ws.cell(row=row_count+1, column=col_count+1).value = month_gen[i][col_count-1]
+				col_count += 1
+			ws.cell(row=1, column=col_count+1).value = "Outage Days"
+			ws.cell(row=row_count+1, column=col_count+1).border = leftBorder
+			ws.cell(row=row_count+1, column=col_count+1).value = off_days[i]
+			row_count += 1
+			stats.count("cells", len(dates) + 2)
+			stats.progress(i+1, len(SMIs))
+
+		wb.save(output)
+	stats.end("write")
+	cxn.close()
+
+	print ("Complete!")
+	runstats.finish(stats, args)
\ No newline at end of file
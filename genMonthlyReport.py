@@ -5,9 +5,14 @@
 # Source code: https://github.com/con-mcleod/MonthlyPerf_Report
 # Latest Update: 10 August 2018
 
-import sys, sqlite3, os
+import sys, sqlite3, os, argparse
 from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Color, Font, PatternFill, Border, Side
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.utils import get_column_letter
+import schema, runstats, catalog
+import report_outputs
 
 ##############################
 #                            #
@@ -36,195 +41,391 @@ def dbselect(cxn, query, payload):
 
 ##############################
 #                            #
-# Helper functions           #
+# Bulk report loader         #
 #                            #
 ##############################
 
-def get_all_SMIs(cxn):
+# the report periods in the order they are laid out
+perfPeriods = ["Annual", "Quarter", "Month", "Prev"]
+
+# number of Salesforce detail and forecast columns left blank for a site not in Salesforce
+missingDetailCols = 22
+
+# performance below LOW_PERF is highlighted red and above HIGH_PERF green
+LOW_PERF = .9
+HIGH_PERF = 1.2
+
+# each SMI's monthly forecasts and generation and its performance summary, in SMI order
+FORECAST_BY_SMI = "SELECT SMI, adj_val from ADJ_FORECAST order by SMI, year, month"
+GEN_BY_SMI = "SELECT SMI, val from MONTH_GEN order by SMI, year, month"
+PERF_BY_SMI = """SELECT SMI, period, fc, gen, perf, off_days, fc_revenue, gen_revenue,
+	shortfall from PERF_SUMMARY order by SMI"""
+
+
+class SiteRecord(object):
 	"""
-	Function to grab all SMIs from the Encompass reports
-	:param cxn: connection to sqlite3 database
-	:return all_SMIs: list of all SMIs
+	Everything the Perf Report shows for one SMI
+	details: tuple of Salesforce details or None if the SMI is not in Salesforce
+	forecasts: list of Salesforce monthly forecasts
+	adj_forecasts: list of adjusted forecasts ordered by year, month
+	generation: list of monthly generation ordered by year, month
+	perf: dictionary of period to (fc, gen, perf, off_days, fc_revenue, gen_revenue, shortfall)
 	"""
-	query = "SELECT distinct(SMI) from DAILY_GEN"
-	payload = None
-	all_SMIs = dbselect(cxn, query, payload)
-	return all_SMIs
+	__slots__ = ["SMI", "details", "forecasts", "adj_forecasts", "generation", "perf"]
 
+	def __init__(self, SMI):
+		self.SMI = SMI
+		self.details = None
+		self.forecasts = []
+		self.adj_forecasts = []
+		self.generation = []
+		self.perf = {}
 
-def get_all_months(cxn):
+
+def get_values_by_SMI(cxn, query):
 	"""
-	Function to return all months included in the Encompass reports
+	Function to group the rows of a table by SMI in one pass
 	:param cxn: connection to sqlite3 database
-	:return all_dates: list of all months in report [mm, yy]
+	:param query: SELECT of SMI followed by the values, ordered by SMI
+	:return result: dictionary of SMI to its list of rows without the SMI
 	"""
-	query = """SELECT obs_month, obs_year from DAILY_GEN 
-			group by obs_month, obs_year order by obs_year, obs_month"""
-	payload = None
-	all_dates = dbselect(cxn, query, payload)
-	return all_dates
+	result = {}
+	for row in dbselect(cxn, query, None):
+		result.setdefault(row[0], []).append(row[1:])
+	return result
 
 
-def get_last_date(cxn):
+def load_report_records(cxn, SMIs, dates, forecast_rows=None):
 	"""
-	Function to return the date of the last data entry from Encompass reports
+	Function to load the whole fleet's report data with one scan of each table
 	:param cxn: connection to sqlite3 database
-	:return last_date: last date of Encompass reports
+	:param SMIs: list of all SMIs
+	:param dates: list of all months in the report
+	:param forecast_rows: list of (SMI, month, val) already read from FORECAST in SMI, month
+		order, if any
+	:return records: list of SiteRecord in the order of SMIs
 	"""
-	query = """SELECT obs_day, obs_month, obs_year from DAILY_GEN
-			group by obs_day, obs_month, obs_year order by obs_year, obs_month, obs_day"""
-	payload = None
-	all_dates = dbselect(cxn, query, payload)
-	last_date = all_dates[-1]
-	return last_date
+	details = get_values_by_SMI(cxn, """SELECT SMI, ref_no, state, installer, PVsize,
+		export_control, panel_brand, site_type, site_status, supply_date, tariff from SMI_DETAILS""")
+	if forecast_rows is None:
+		forecasts = get_values_by_SMI(cxn, "SELECT SMI, val from FORECAST order by SMI, month")
+	else:
+		forecasts = {}
+		for SMI, month, val in forecast_rows:
+			forecasts.setdefault(SMI, []).append((val,))
+	adj_forecasts = get_values_by_SMI(cxn, FORECAST_BY_SMI)
+	generation = get_values_by_SMI(cxn, GEN_BY_SMI)
+	perf = get_values_by_SMI(cxn, PERF_BY_SMI)
+
+	records = []
+	for SMI in SMIs:
+		record = SiteRecord(SMI[0])
+		if SMI[0] in details:
+			record.details = details[SMI[0]][0]
+		record.forecasts = [row[0] for row in forecasts.get(SMI[0], [])]
+		record.adj_forecasts = [row[0] for row in adj_forecasts.get(SMI[0], [])]
+		record.generation = [row[0] for row in generation.get(SMI[0], [])]
+		if not record.generation:
+			record.generation = [0]*len(dates)
+		for row in perf.get(SMI[0], []):
+			record.perf[row[0]] = row[1:]
+		for period in perfPeriods:
+			if period not in record.perf:
+				record.perf[period] = (0, 0, 0, 0, None, None, None)
+		records.append(record)
+	return records
 
+##############################
+#                            #
+# Row building               #
+#                            #
+##############################
 
-def get_SMI_details(cxn, SMI):
+def get_headings(dates):
 	"""
-	Function to return an SMI's Salesforce details
-	:param cxn: connection to sqlite3 database
-	:param SMI: the SMI of interest
-	:return result: list of SMI's Salesforce details
+	Function to return the Perf Report column headings
+	:param dates: list of all months in the report
+	:return ws_headings: list of headings
 	"""
-	query = """SELECT ref_no, state, installer, PVsize, export_control,
-		panel_brand, site_type, site_status, supply_date, tariff from SMI_DETAILS where SMI=?"""
-	payload = (SMI)
-	result = dbselect(cxn, query, payload)
-	if not result:
-		for i in range(0,22):
-			result.append((''))
-	return result
+	ws_headings = ["SMI","Ref No","State","Installer","System Size","Export Control",
+					"Panel Make","System Type","PPA Status","Supply Date","Tariff","Jan FC","Feb FC", "Mar FC",
+					"Apr FC","May FC","Jun FC","Jul FC","Aug FC","Sep FC","Oct FC",
+					"Nov FC","Dec FC"]
+	for date in dates:
+		date = "adj_fc(" + str(date).strip('()') + ")"
+		ws_headings.append(date)
+	for date in dates:
+		date = "gen(" + str(date).strip('()') + ")"
+		ws_headings.append(date)
+	ws_headings.extend(["Annual FC","Annual Gen","Annual Perf","Quarter FC","Quarter Gen",
+						"Quater Perf","Month FC","Month Gen","Month Perf","Prev FC",
+						"Prev Gen","Prev Perf","Outage Days","Annual FC $","Annual Gen $","Shortfall $",
+						"Quarter FC $","Quarter Gen $","Shortfall $","CurrMonth FC $","CurrMonth Gen $",
+						"Shortfall $","PrevMonth FC $","PrevMonth Gen $","Shortfall $"])
+	return ws_headings
+
 
+# openpyxl cell formatting, looked up by the style names the row builder gives each cell
+redFill = PatternFill(start_color='FA5858', end_color='FA5858', fill_type='solid')
+greenFill = PatternFill(start_color='9Afe2e', end_color='9Afe2e', fill_type='solid')
+leftBorder = Border(left=Side(style='thin'))
+rightBorder = Border(right=Side(style='thin'))
+cellStyles = {
+	"left": ("border", leftBorder),
+	"right": ("border", rightBorder),
+	"red": ("fill", redFill),
+	"green": ("fill", greenFill),
+	"pct": ("number_format", '0.00%'),
+}
 
-def get_SMI_forecast(cxn, SMI):
+
+def build_perf_row(record, low=LOW_PERF, high=HIGH_PERF, conditional=False):
 	"""
-	Function to return an SMI's forecast data
-	:param cxn: connection to sqlite3 database
-	:param SMI: the SMI of interest
-	:return result: list of forecast values
+	Function to lay out an SMI's Perf Report row from its SiteRecord
+	:param record: the SiteRecord of the SMI
+	:param low: performance below this is highlighted red
+	:param high: performance above this is highlighted green
+	:param conditional: leave the fills and borders to add_conditional_formats and
+		only give the cells their number format
+	:return row: list of (value, style names) for each column from column 1, the style
+		names applied in order so a later border replaces an earlier one
 	"""
-	query = "SELECT val from FORECAST where SMI=?"
-	payload = (SMI)
-	result = dbselect(cxn, query, payload)
-	return result
+	values = {}
+	styles = {}
+
+	def put(col, value):
+		values[col] = value
 
+	def style(col, name):
+		if conditional and name != "pct":
+			return
+		styles.setdefault(col, []).append(name)
 
+	put(1, record.SMI)
+	col_count = 1
+
+	# add Salesforce details
+	if record.details:
+		for detail in record.details:
+			put(col_count+1, detail)
+			col_count += 1
+	else:
+		for i in range(0, missingDetailCols):
+			put(col_count+1, '')
+			col_count += 1
+
+	# add Salesforce forecasts
+	style(col_count+1, "left")
+	for forecast in record.forecasts:
+		put(col_count+1, forecast)
+		col_count += 1
+
+	# if no supply date, skip SMI from performance metrics and highlight red
+	if not record.details or not record.details[8]:
+		style(1, "red")
+	else:
+		# add adjusted forecast based on supply date and monthly generation from encompass
+		for monthly in [record.adj_forecasts, record.generation]:
+			style(col_count+1, "left")
+			for val in monthly:
+				put(col_count+1, val)
+				col_count += 1
 
-def get_SMI_adj_forecast(cxn, SMI):
+		# add the performance columns for each period
+		for period in perfPeriods:
+			fc, gen, perf = record.perf[period][:3]
+			put(col_count+1, fc)
+			style(col_count+1, "left")
+			put(col_count+2, gen)
+			put(col_count+3, perf)
+			style(col_count+3, "pct")
+			if perf < low:
+				style(col_count+3, "red")
+			elif perf > high:
+				style(col_count+3, "green")
+			if period == "Prev":
+				style(col_count+3, "right")
+			col_count += 3
+
+		# add number of off days in the current month
+		off_days = record.perf["Month"][3]
+		style(col_count+1, "right")
+		put(col_count+1, off_days)
+		if off_days:
+			style(col_count+1, "red")
+		col_count += 1
+
+		# add revenue impact if tariff exists
+		if record.perf["Annual"][4] is not None:
+			for period in perfPeriods:
+				for val in record.perf[period][4:]:
+					put(col_count+1, val)
+					col_count += 1
+				style(col_count, "right")
+
+	row = []
+	for col in range(1, max(list(values) + list(styles)) + 1):
+		row.append((values.get(col), styles.get(col, [])))
+	return row
+
+
+def write_perf_row(ws, row_num, row):
 	"""
-	Function to return an SMI's adjusted forecast data
-	:param cxn: connection to sqlite3 database
-	:param SMI: the SMI of interest
-	:return result: list of adjusted forecast values
+	Function to write a row from build_perf_row to a worksheet
+	:param ws: the worksheet
+	:param row_num: the worksheet row to write
+	:param row: list of (value, style names) from build_perf_row
+	:return:
 	"""
-	query = "SELECT adj_val from ADJ_FORECAST where SMI=?"
-	payload = (SMI)
-	result = dbselect(cxn, query, payload)
-	return result
+	for col, (value, names) in enumerate(row, 1):
+		if value is None and not names:
+			continue
+		cell = ws.cell(row=row_num, column=col)
+		cell.value = value
+		for name in names:
+			setattr(cell, cellStyles[name][0], cellStyles[name][1])
 
 
-def get_SMI_generation(cxn, SMI):
+def add_conditional_formats(ws, num_rows, dates, low=LOW_PERF, high=HIGH_PERF):
 	"""
-	Function to return an SMI's adjusted monthly generation
-	:param cxn: connection to sqlite3 database
-	:param SMI: the SMI of interest
-	:return result: list of SMI's adjusted monthly generation
+	Function to express the Perf Report highlights and column separators as a few
+	conditional formatting rules over whole columns instead of styling every cell
+	:param ws: the Perf Report worksheet
+	:param num_rows: number of SMI rows below the headings
+	:param dates: list of all months in the report
+	:param low: performance below this is highlighted red
+	:param high: performance above this is highlighted green
+	:return:
 	"""
-	query = "SELECT val from MONTH_GEN where SMI=? order by year, month"
-	payload = (SMI)
-	result = dbselect(cxn, query, payload)
-	if not result:
-		for i in range(0,len(dates)):
-			result.append((0,))
-	return result
+	if not num_rows:
+		return
+	last_row = num_rows + 1
+
+	def col_range(col):
+		letter = get_column_letter(col)
+		return letter + "2:" + letter + str(last_row)
+
+	def first_cell(col):
+		return get_column_letter(col) + "2"
+
+	# columns of the sheet as laid out by build_perf_row for a site with a supply date
+	fc_col = 2 + 10
+	perf_col = fc_col + 12 + 2*len(dates)
+	off_days_col = perf_col + 12
+	revenue_col = off_days_col + 1
+
+	# no supply date in column J flags the SMI red
+	ws.conditional_formatting.add(col_range(1), FormulaRule(formula=['LEN($J2)=0'],
+		fill=redFill))
+
+	# performance of each period against the thresholds
+	for period in range(0, 4):
+		col = perf_col + 3*period + 2
+		cell = first_cell(col)
+		ws.conditional_formatting.add(col_range(col), FormulaRule(
+			formula=['AND(ISNUMBER(' + cell + '),' + cell + '<' + str(low) + ')'], fill=redFill))
+		ws.conditional_formatting.add(col_range(col), FormulaRule(
+			formula=['AND(ISNUMBER(' + cell + '),' + cell + '>' + str(high) + ')'], fill=greenFill))
+
+	# any off days in the current month
+	cell = first_cell(off_days_col)
+	ws.conditional_formatting.add(col_range(off_days_col), FormulaRule(
+		formula=['AND(ISNUMBER(' + cell + '),' + cell + '>0)'], fill=redFill))
+
+	# separators before the forecasts, adjusted forecasts, generation and each period,
+	# and after the performance, off days and each revenue group
+	left_cols = [fc_col, fc_col + 12, fc_col + 12 + len(dates)]
+	left_cols.extend([perf_col + 3*period for period in range(0, 4)])
+	right_cols = [perf_col + 11, off_days_col]
+	right_cols.extend([revenue_col + 3*period + 2 for period in range(0, 4)])
+	ws.conditional_formatting.add(" ".join([col_range(col) for col in left_cols]),
+		FormulaRule(formula=['TRUE'], border=leftBorder))
+	ws.conditional_formatting.add(" ".join([col_range(col) for col in right_cols]),
+		FormulaRule(formula=['TRUE'], border=rightBorder))
+
+
+def get_rows(records):
+	"""
+	Function to yield the Perf Report rows as plain values for the non-Excel formats
+	:param records: list of SiteRecord from load_report_records
+	:return: generator of rows matching get_headings
+	"""
+	for record in records:
+		yield [value for value, names in build_perf_row(record, conditional=True)]
 
+##############################
+#                            #
+# Streaming output           #
+#                            #
+##############################
 
-def get_perf(cxn, SMI, period):
+def write_perf_row_streaming(ws, row):
 	"""
-	Function to return an SMI's adjusted monthly generation
-	:param cxn: connection to sqlite3 database
-	:param SMI: the SMI of interest
-	:param period: the period of interest (annual, quarter, month, prev month)
-	:return fc: list of forecasts for each month in period
-	:return gen: list of generation values for each month in period
-	:return perf: list of generation/forecast as a % for each month in period
+	Function to append a row from build_perf_row to a write-only worksheet
+	:param ws: the write-only worksheet
+	:param row: list of (value, style names) from build_perf_row
+	:return:
 	"""
-	fc = 0
-	gen = 0
-	query = "SELECT adj_val from ADJ_FORECAST where SMI=? order by year, month"
-	payload = (SMI)
-	fc_vals = dbselect(cxn, query, payload)
-	if (period == "Annual"):
-		fc_vals = fc_vals[-12:]
-	elif (period == "Quarter"):
-		fc_vals = fc_vals[-3:]
-	elif (period == "Month"):
-		fc_vals = fc_vals[-1:]
-
-	if fc_vals:
-		if (period == "Prev"):
-			fc_vals = fc_vals[-2]
-
-	query = "SELECT val from MONTH_GEN where SMI=? order by year, month"
-	payload = (SMI)
-	gen_vals = dbselect(cxn, query, payload)[-12:]
-	if (period == "Annual"):
-		gen_vals = gen_vals[-12:]
-	elif (period == "Quarter"):
-		gen_vals = gen_vals[-3:]
-	elif (period == "Month"):
-		gen_vals = gen_vals[-1:]
-	
-	if gen_vals:
-		if (period == "Prev"):
-			gen_vals = gen_vals[-2]
-
-	if period == "Prev":
-		for fc_val in fc_vals:
-			fc += fc_val
-		for gen_val in gen_vals:
-			gen += gen_val
-		if (fc != 0):
-			perf = gen/fc
-		else:
-			perf = 0
-	else:
-		for fc_val in fc_vals:
-			fc += fc_val[0]
-		for gen_val in gen_vals:
-			gen += gen_val[0]
-		if (fc != 0):
-			perf = gen/fc
-		else:
-			perf = 0
-	return fc, gen, perf
-
-
-def get_off_days(cxn, SMI, dates):
+	cells = []
+	for value, names in row:
+		if not names:
+			cells.append(value)
+			continue
+		cell = WriteOnlyCell(ws, value=value)
+		for name in names:
+			setattr(cell, cellStyles[name][0], cellStyles[name][1])
+		cells.append(cell)
+	ws.append(cells)
+
+
+def write_perf_report_sheet(wb, records, dates, low=LOW_PERF, high=HIGH_PERF, conditional=False,
+		stats=None):
 	"""
-	Function to return the number of days a site had zero generation in a given month
-	:param cxn: connection to sqlite3 database
-	:param SMI: the SMI of interest
-	:param dates: all dates given from Encompass files
-	:return off_days: number of days of zero generation in the current month for an SMI
+	Function to write the Perf Report sheet a whole row at a time to a write-only workbook
+	:param wb: the write-only workbook
+	:param records: list of SiteRecord from load_report_records
+	:param dates: list of all months in the report
+	:param low: performance below this is highlighted red
+	:param high: performance above this is highlighted green
+	:param conditional: use conditional formatting rules instead of per-cell styles
+	:param stats: RunStats to count the cells written and show progress on, if any
+	:return:
+	"""
+	ws = wb.create_sheet("Perf Report")
+	if records:
+		ws.append(get_headings(dates))
+	for num, record in enumerate(records):
+		row = build_perf_row(record, low, high, conditional)
+		write_perf_row_streaming(ws, row)
+		if stats:
+			stats.count("cells", len(row))
+			stats.progress(num+1, len(records))
+	if conditional:
+		add_conditional_formats(ws, len(records), dates, low, high)
+
+
+def get_unsupplied_SMIs(records):
+	"""
+	Function to find the SMIs in the report without a supply date in Salesforce
+	:param records: list of SiteRecord from load_report_records
+	:return: list of SMIs with no supply date
 	"""
-	curr_date = dates[-1]
-	curr_month = curr_date[0]
-	curr_year = curr_date[1]
-	off_days = 0
-	query = """SELECT value from DAILY_GEN where SMI=? and obs_month=? 
-				and obs_year=?"""
-	payload = (SMI[0], curr_month, curr_year)
-	result = dbselect(cxn, query, payload)
-	if result:
-		for val in result:
-			if not val[0]:
-				off_days += 1
-			elif val[0] < 0.1:
-				off_days += 1
-	return off_days
+	return [record.SMI for record in records if not record.details or not record.details[8]]
 
 
+def add_format_arguments(parser):
+	"""
+	Function to add the Perf Report formatting options to a command line parser
+	:param parser: the argparse parser
+	:return:
+	"""
+	parser.add_argument("--conditional-format", action="store_true",
+		help="highlight with conditional formatting rules instead of styling every cell")
+	parser.add_argument("--low", type=float, default=LOW_PERF,
+		help="highlight performance below this red (default %(default)s)")
+	parser.add_argument("--high", type=float, default=HIGH_PERF,
+		help="highlight performance above this green (default %(default)s)")
+
 ##############################
 #                            #
 # GENERATE OUTPUT            #
@@ -234,56 +435,66 @@ def get_off_days(cxn, SMI, dates):
 if __name__ == '__main__':
 
 	# terminate program if not executed correctly
-	if (len(sys.argv) != 1):
-		print ("Usage: python3 genMonthlyReport.py")
-		exit(1)
+	parser = argparse.ArgumentParser(description="Add the Perf Report sheet to the monthly report")
+	add_format_arguments(parser)
+	parser.add_argument("--format", choices=["xlsx"] + sorted(report_outputs.OUTPUT_FORMATS),
+		default="xlsx", help="add the sheet to the Excel report or write it as a plain data file "
+		+ "(default %(default)s)")
+	runstats.add_arguments(parser)
+	args = parser.parse_args()
 
 	# connect to the sqlite3 database
 	DATABASE = "dataset.db"
 	cxn = sqlite3.connect(DATABASE)
+	schema.migrate(cxn)
+	stats = runstats.start("genMonthlyReport", args, cxn)
 
 	# name the output file using YY.MM.DD.xlsx format
-	last_date = get_last_date(cxn)
-	output = str(last_date[2])+"."+str(last_date[1])+"."+str(last_date[0]) + ".xlsx"
+	last_date = catalog.get_last_date(cxn)
+	report = str(last_date[2])+"."+str(last_date[1])+"."+str(last_date[0])
+	output = report + ".xlsx"
+
+	# write the same columns to a plain data file without touching the workbook
+	if args.format != "xlsx":
+		with stats.timer("query"):
+			dates = catalog.get_all_months(cxn)
+			records = load_report_records(cxn, catalog.get_all_SMIs(cxn), dates)
+		with stats.timer("write"):
+			output = report_outputs.output_path(report, "Perf Report", args.format)
+			report_outputs.write_rows(args.format, output, get_headings(dates), get_rows(records))
+		print ("Written " + output)
+		print ("Complete!")
+		runstats.finish(stats, args)
+		exit(0)
 
 	# open the output file because it should already exist from genAllSites.py
-	wb = load_workbook(output)
+	with stats.timer("load_workbook"):
+		wb = load_workbook(output)
+
+	# start the sheet afresh in its place, so no values, fills, borders, number formats or
+	# rules from an earlier run are left behind
+	index = None
 	if 'Perf Report' in wb.sheetnames:
-		ws = wb.get_sheet_by_name('Perf Report')
-	else:
-		ws = wb.create_sheet('Perf Report')
+		index = wb.sheetnames.index('Perf Report')
+		wb.remove(wb['Perf Report'])
+	ws = wb.create_sheet('Perf Report', index)
 
-	# openpyxl cell formatting
-	redFill = PatternFill(start_color='FA5858', end_color='FA5858', fill_type='solid')
-	greenFill = PatternFill(start_color='9Afe2e', end_color='9Afe2e', fill_type='solid')
-	leftBorder = Border(left=Side(style='thin'))
-	rightBorder = Border(right=Side(style='thin'))
+	# grab column and row data types and load the whole fleet up front
+	with stats.timer("query"):
+		SMIs = catalog.get_all_SMIs(cxn)
+		dates = catalog.get_all_months(cxn)
+		records = load_report_records(cxn, SMIs, dates)
 
-	# grab column and row data types
-	SMIs = get_all_SMIs(cxn)
-	dates = get_all_months(cxn)
+	# sites without a supply date still get their row in the report
+	stats.list_SMIs("have no supply date", get_unsupplied_SMIs(records))
 
 	# create the headings
-	ws_headings = ["SMI","Ref No","State","Installer","System Size","Export Control",
-					"Panel Make","System Type","PPA Status","Supply Date","Tariff","Jan FC","Feb FC", "Mar FC",
-					"Apr FC","May FC","Jun FC","Jul FC","Aug FC","Sep FC","Oct FC",
-					"Nov FC","Dec FC"]
-	for date in dates:
-		date = "adj_fc(" + str(date).strip('()') + ")"
-		ws_headings.append(date)
-	for date in dates:
-		date = "gen(" + str(date).strip('()') + ")"
-		ws_headings.append(date)
-	ws_headings.extend(["Annual FC","Annual Gen","Annual Perf","Quarter FC","Quarter Gen",
-						"Quater Perf","Month FC","Month Gen","Month Perf","Prev FC",
-						"Prev Gen","Prev Perf","Outage Days","Annual FC $","Annual Gen $","Shortfall $",
-						"Quarter FC $","Quarter Gen $","Shortfall $","CurrMonth FC $","CurrMonth Gen $",
-						"Shortfall $","PrevMonth FC $","PrevMonth Gen $","Shortfall $"])
+	ws_headings = get_headings(dates)
 
-	# loop through each SMI and add the data
+	# write each SMI's row from its record
+	stats.begin("write")
 	row_count = 1
-	for SMI in SMIs:
-		print ("Formatting SMI: " + SMI[0])
+	for record in records:
 		col_count = 0
 
 		# print headings
@@ -291,175 +502,23 @@ if __name__ == '__main__':
 			for heading in ws_headings:
 				ws.cell(row=row_count, column=col_count+1).value = heading
 				col_count += 1
-		col_count = 1
-		
-		ws.cell(row=row_count+1, column=1).value = SMI[0]
-		
-		# add Salesforce details
-		details = get_SMI_details(cxn, SMI)
-		if details:
-			if details[0]:
-				for detail in details[0]:
-					ws.cell(row=row_count+1, column=col_count+1).value = detail
-					col_count += 1
-			else:
-				for i in range(0,len(details)):
-					ws.cell(row=row_count+1, column=col_count+1).value = ''
-					col_count += 1
-		
-		# add Salesforce forecasts
-		forecasts = get_SMI_forecast(cxn, SMI)
-		ws.cell(row=row_count+1, column=col_count+1).border = leftBorder
-		for forecast in forecasts:
-			ws.cell(row=row_count+1, column=col_count+1).value = forecast[0]
-			col_count += 1
-
-		# if no supply date, skip SMI from performance metrics and highlight red
-		if not details[0][8]:
-			print ("No supply date for: " + SMI[0] + " - skipping")
-			ws.cell(row=row_count+1, column=1).fill = redFill
-			row_count += 1
-			continue
-
-		# add adjusted forecast based on supply date
-		adj_forecasts = get_SMI_adj_forecast(cxn, SMI)
-		ws.cell(row=row_count+1, column=col_count+1).border = leftBorder
-		for adj_forecast in adj_forecasts:
-			ws.cell(row=row_count+1, column=col_count+1).value = adj_forecast[0]
-			col_count += 1
-		
-		# add monthly generation from encompass
-		month_gen = get_SMI_generation(cxn, SMI)
-		ws.cell(row=row_count+1, column=col_count+1).border = leftBorder
-		for gen in month_gen:
-			ws.cell(row=row_count+1, column=col_count+1).value = gen[0]
-			col_count += 1
-		
-		# add annual performance columns
-		i = 0
-		annual_perf = get_perf(cxn, SMI, "Annual")
-		for val in annual_perf:
-			ws.cell(row=row_count+1, column=col_count+1).value = val
-			if i == 0:
-				ws.cell(row=row_count+1, column=col_count+1).border = leftBorder
-			if i == 2:
-				ws.cell(row=row_count+1, column=col_count+1).number_format = '0.00%'
-				if val < .9:
-					ws.cell(row=row_count+1, column=col_count+1).fill = redFill
-				elif val > 1.2:
-					ws.cell(row=row_count+1, column=col_count+1).fill = greenFill
-			col_count += 1
-			i += 1
-
-		# add quarter performance columns
-		i = 0
-		quarter_perf = get_perf(cxn, SMI, "Quarter")
-		for val in quarter_perf:
-			ws.cell(row=row_count+1, column=col_count+1).value = val
-			if i == 0:
-				ws.cell(row=row_count+1, column=col_count+1).border = leftBorder
-			if i == 2:
-				ws.cell(row=row_count+1, column=col_count+1).number_format = '0.00%'
-				if val < .9:
-					ws.cell(row=row_count+1, column=col_count+1).fill = redFill
-				elif val > 1.2:
-					ws.cell(row=row_count+1, column=col_count+1).fill = greenFill
-			col_count += 1
-			i += 1
-
-		# add monthly performance columns
-		i = 0
-		month_perf = get_perf(cxn, SMI, "Month")
-		for val in month_perf:
-			ws.cell(row=row_count+1, column=col_count+1).value = val
-			if i == 0:
-				ws.cell(row=row_count+1, column=col_count+1).border = leftBorder
-			if i == 2:
-				ws.cell(row=row_count+1, column=col_count+1).number_format = '0.00%'
-				if val < .9:
-					ws.cell(row=row_count+1, column=col_count+1).fill = redFill
-				elif val > 1.2:
-					ws.cell(row=row_count+1, column=col_count+1).fill = greenFill
-			col_count += 1
-			i += 1
-
-		# add last months performance columns
-		i = 0
-		last_month_perf = get_perf(cxn, SMI, "Prev")
-		for val in last_month_perf:
-			ws.cell(row=row_count+1, column=col_count+1).value = val
-			if i == 0:
-				ws.cell(row=row_count+1, column=col_count+1).border = leftBorder
-			if i == 2:
-				ws.cell(row=row_count+1, column=col_count+1).number_format = '0.00%'
-				if val < .9:
-					ws.cell(row=row_count+1, column=col_count+1).fill = redFill
-				elif val > 1.2:
-					ws.cell(row=row_count+1, column=col_count+1).fill = greenFill
-				ws.cell(row=row_count+1, column=col_count+1).border = rightBorder
-			col_count += 1
-			i += 1
-		
-		# add number of off days
-		off_days = get_off_days(cxn, SMI, dates)
-		ws.cell(row=row_count+1, column=col_count+1).border = rightBorder
-		ws.cell(row=row_count+1, column=col_count+1).value = off_days
-		if (off_days):
-			if off_days > 0:
-				ws.cell(row=row_count+1, column=col_count+1).fill = redFill
 
-		col_count += 1
-
-		# add tariff
-		tariff = None
-		if (details[0]):
-			if details[0][9]:
-				tariff = float(details[0][9])
-		
-		# add revenue impact if tariff exists
-		if tariff:
-			revenues = []
-			for val in annual_perf[:2]:
-				revenue = (val*tariff)/100
-				ws.cell(row=row_count+1, column=col_count+1).value = revenue
-				revenues.append(revenue)
-				col_count += 1
-			ws.cell(row=row_count+1, column=col_count+1).value = (revenues[1]-revenues[0])
-			ws.cell(row=row_count+1, column=col_count+1).border = rightBorder
-			col_count += 1
-
-			revenues = []
-			for val in quarter_perf[:2]:
-				revenue = (val*tariff)/100
-				ws.cell(row=row_count+1, column=col_count+1).value = revenue
-				revenues.append(revenue)
-				col_count += 1
-			ws.cell(row=row_count+1, column=col_count+1).value = (revenues[1]-revenues[0])
-			ws.cell(row=row_count+1, column=col_count+1).border = rightBorder
-			col_count += 1
-
-			revenues = []
-			for val in month_perf[:2]:
-				revenue = (val*tariff)/100
-				ws.cell(row=row_count+1, column=col_count+1).value = revenue
-				revenues.append(revenue)
-				col_count += 1
-			ws.cell(row=row_count+1, column=col_count+1).value = (revenues[1]-revenues[0])
-			ws.cell(row=row_count+1, column=col_count+1).border = rightBorder
-			col_count += 1
+		row = build_perf_row(record, args.low, args.high, args.conditional_format)
+		write_perf_row(ws, row_count+1, row)
+		stats.count("cells", len(row))
+		stats.progress(row_count, len(records))
+		row_count += 1
 
-			revenues = []
-			for val in last_month_perf[:2]:
-				revenue = (val*tariff)/100
-				ws.cell(row=row_count+1, column=col_count+1).value = revenue
-				revenues.append(revenue)
-				col_count += 1
-			ws.cell(row=row_count+1, column=col_count+1).value = (revenues[1]-revenues[0])
-			ws.cell(row=row_count+1, column=col_count+1).border = rightBorder
+	# highlight with a few ranged rules
+	if args.conditional_format:
+		add_conditional_formats(ws, len(records), dates, args.low, args.high)
 
-		row_count += 1
+	stats.end("write")
 
 	# save the excel file
-	wb.save(output)
+	with stats.timer("save"):
+		wb.save(output)
+	cxn.close()
 
-	print ("Complete!")
\ No newline at end of file
+	print ("Complete!")
+	runstats.finish(stats, args)
\ No newline at end of file
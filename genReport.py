@@ -0,0 +1,245 @@
+#!/usr/bin/python3
+
+# Author: Connor McLeod
+# Contact: con.mcleod92@gmail.com
+# Source code: https://github.com/con-mcleod/MonthlyPerf_Report
+
+import sqlite3, os, re, argparse
+from concurrent.futures import ProcessPoolExecutor
+from openpyxl import Workbook
+from openpyxl.styles import Font
+import schema, runstats, catalog
+import genAllSites, genMonthlyReport
+
+# SMI_DETAILS columns a report can be sharded by
+shardColumns = ["state", "installer", "site_type"]
+
+# shard for sites without the column in Salesforce
+unknownShard = "Unknown"
+
+##############################
+#                            #
+# Sharded reports            #
+#                            #
+##############################
+
+def get_shards(cxn, SMIs, shard_by):
+	"""
+	Function to partition the SMIs by a Salesforce column
+	:param cxn: connection to sqlite3 database
+	:param SMIs: list of all SMIs
+	:param shard_by: the SMI_DETAILS column to partition by, one of shardColumns
+	:return shards: dictionary of shard name to list of indexes into SMIs, in name order
+	"""
+	query = "SELECT SMI, " + shard_by + " from SMI_DETAILS"
+	segments = dict(cxn.execute(query).fetchall())
+	shards = {}
+	for i, SMI in enumerate(SMIs):
+		segment = segments.get(SMI[0])
+		if segment is None or str(segment).strip() == '':
+			segment = unknownShard
+		shards.setdefault(str(segment).strip(), []).append(i)
+	return dict(sorted(shards.items()))
+
+
+def index_path(report):
+	"""
+	Function to name the index workbook of a sharded report
+	:param report: the report name in YY.MM.DD format
+	:return: the file name, e.g. 18.6.23_index.xlsx
+	"""
+	return report + "_index.xlsx"
+
+
+def shard_paths(report, shards):
+	"""
+	Function to name each shard's workbook, e.g. 18.6.23_NSW.xlsx, keeping the names unique
+	Shards whose names clean up to the same file name, ignoring case as Windows does, are
+	numbered in shard order, e.g. A&B Solar and A-B Solar write _A_B_Solar and _A_B_Solar_2
+	:param report: the report name in YY.MM.DD format
+	:param shards: the shard names in order
+	:return paths: list of file names in the order of shards
+	"""
+	paths = []
+	used = set([index_path(report).lower()])
+	for shard in shards:
+		name = re.sub(r"[^A-Za-z0-9]+", "_", shard).strip("_") or "shard"
+		path = report + "_" + name + ".xlsx"
+		num = 1
+		while path.lower() in used:
+			num += 1
+			path = report + "_" + name + "_" + str(num) + ".xlsx"
+		used.add(path.lower())
+		paths.append(path)
+	return paths
+
+
+def write_shard(output, SMIs, dates, month_gen, off_days, records, low, high, conditional):
+	"""
+	Function to write one shard's All_sites and Perf Report sheets to its own workbook
+	Runs in a worker process so it only takes picklable values
+	:param output: the xlsx file to write
+	:param SMIs: the shard's SMIs
+	:param dates: list of all months in the report
+	:param month_gen: the shard's rows of the SMI x month generation matrix
+	:param off_days: off days for each of the shard's SMIs
+	:param records: the shard's SiteRecords
+	:param low: performance below this is highlighted red
+	:param high: performance above this is highlighted green
+	:param conditional: use conditional formatting rules instead of per-cell styles
+	:return: tuple of (output, number of SMIs)
+	"""
+	wb = Workbook(write_only=True)
+	genAllSites.write_all_sites_sheet(wb, SMIs, dates, month_gen, off_days)
+	genMonthlyReport.write_perf_report_sheet(wb, records, dates, low, high, conditional)
+	wb.save(output)
+	return output, len(SMIs)
+
+
+def write_index(output, shard_by, written):
+	"""
+	Function to write a small workbook linking to each shard's workbook
+	:param output: the xlsx file to write
+	:param shard_by: the column the report was sharded by
+	:param written: list of (shard, shard file, number of SMIs)
+	:return:
+	"""
+	wb = Workbook()
+	ws = wb.active
+	ws.title = "Index"
+	ws.append([shard_by, "Sites", "Report"])
+	for shard, path, count in written:
+		ws.append([shard, count, path])
+		cell = ws.cell(row=ws.max_row, column=3)
+		cell.hyperlink = path
+		cell.font = Font(color="0563C1", underline="single")
+	wb.save(output)
+
+
+def write_sharded_reports(report, SMIs, dates, month_gen, off_days, records, shards,
+		workers, low, high, conditional):
+	"""
+	Function to write one workbook per shard in a pool of worker processes
+	:param report: the report name in YY.MM.DD format
+	:param SMIs: list of all SMIs
+	:param dates: list of all months in the report
+	:param month_gen: SMI x month generation matrix
+	:param off_days: off days for each SMI
+	:param records: SiteRecord for each SMI
+	:param shards: dictionary of shard name to list of indexes into SMIs
+	:param workers: number of worker processes, 1 writes every shard in this process
+	:param low: performance below this is highlighted red
+	:param high: performance above this is highlighted green
+	:param conditional: use conditional formatting rules instead of per-cell styles
+	:return written: list of (shard, shard file, number of SMIs) in shard order
+	"""
+	jobs = []
+	for path, rows in zip(shard_paths(report, shards), shards.values()):
+		jobs.append((path, [SMIs[i] for i in rows], dates,
+			[month_gen[i] for i in rows], [off_days[i] for i in rows],
+			[records[i] for i in rows], low, high, conditional))
+
+	if workers <= 1:
+		results = [write_shard(*job) for job in jobs]
+	else:
+		with ProcessPoolExecutor(max_workers=workers) as pool:
+			results = list(pool.map(write_shard, *zip(*jobs)))
+	return [(shard, path, count) for shard, (path, count) in zip(shards, results)]
+
+##############################
+#                            #
+# Report                     #
+#                            #
+##############################
+
+def generate_report(cxn, report, SMIs, dates, stats, low, high, conditional, shard_by=None,
+		workers=1, forecast_rows=None):
+	"""
+	Function to write the All_sites and Perf Report sheets to one workbook in a single pass,
+	or to one workbook per shard and an index workbook
+	:param cxn: connection to sqlite3 database
+	:param report: the report name in YY.MM.DD format
+	:param SMIs: list of all SMIs
+	:param dates: list of all months in the report
+	:param stats: RunStats for the run
+	:param low: performance below this is highlighted red
+	:param high: performance above this is highlighted green
+	:param conditional: use conditional formatting rules instead of per-cell styles
+	:param shard_by: the SMI_DETAILS column to shard by, or None for a single workbook
+	:param workers: number of processes writing shard workbooks
+	:param forecast_rows: list of (SMI, month, val) already read from FORECAST, if any
+	:return output: the workbook written, or the index workbook when sharded
+	"""
+	# load everything both sheets show before writing anything
+	with stats.timer("query"):
+		month_gen = genAllSites.load_month_gen_matrix(cxn, SMIs, dates)
+		off_days = genAllSites.load_off_days(cxn, SMIs)
+		records = genMonthlyReport.load_report_records(cxn, SMIs, dates, forecast_rows)
+		shards = None
+		if shard_by:
+			shards = get_shards(cxn, SMIs, shard_by)
+
+	# sites without a supply date still get their row in the report
+	stats.list_SMIs("have no supply date", genMonthlyReport.get_unsupplied_SMIs(records))
+
+	stats.begin("write")
+	if shards is not None:
+		# one workbook per shard written in parallel, and the index linking them
+		written = write_sharded_reports(report, SMIs, dates, month_gen, off_days, records,
+			shards, workers, low, high, conditional)
+		output = index_path(report)
+		write_index(output, shard_by, written)
+		print ("Written " + str(len(written)) + " shard workbooks and " + output)
+	else:
+		# stream both sheets into one write-only workbook and save it once
+		output = report + ".xlsx"
+		if (os.path.exists(output)):
+			os.remove(output)
+		wb = Workbook(write_only=True)
+		stats.start_progress("All_sites")
+		genAllSites.write_all_sites_sheet(wb, SMIs, dates, month_gen, off_days, stats)
+		stats.start_progress("Perf Report")
+		genMonthlyReport.write_perf_report_sheet(wb, records, dates, low, high, conditional, stats)
+		wb.save(output)
+	stats.end("write")
+	return output
+
+##############################
+#                            #
+# GENERATE OUTPUT            #
+#                            #
+##############################
+
+if __name__ == '__main__':
+
+	# terminate program if not executed correctly
+	parser = argparse.ArgumentParser(description="Generate the All_sites and Perf Report sheets "
+		+ "of the monthly report in one pass")
+	genMonthlyReport.add_format_arguments(parser)
+	parser.add_argument("--shard-by", choices=shardColumns,
+		help="write one workbook per state, installer or site type plus an index workbook")
+	parser.add_argument("--workers", type=int, default=1,
+		help="number of processes writing shard workbooks (default %(default)s)")
+	runstats.add_arguments(parser)
+	args = parser.parse_args()
+
+	# connect to the sqlite3 database
+	DATABASE = "dataset.db"
+	cxn = sqlite3.connect(DATABASE)
+	schema.migrate(cxn)
+	stats = runstats.start("genReport", args, cxn)
+
+	# name the output file using YY.MM.DD.xlsx format
+	last_date = catalog.get_last_date(cxn)
+	report = str(last_date[2])+"."+str(last_date[1])+"."+str(last_date[0])
+
+	# write the report from everything in the database
+	with stats.timer("query"):
+		dates = catalog.get_all_months(cxn)
+		SMIs = catalog.get_all_SMIs(cxn)
+	generate_report(cxn, report, SMIs, dates, stats, args.low, args.high, args.conditional_format,
+		args.shard_by, args.workers)
+	cxn.close()
+
+	print ("Complete!")
+	runstats.finish(stats, args)
@@ -0,0 +1,230 @@
+#!/usr/bin/python3
+
+# Author: Connor McLeod
+# Contact: con.mcleod92@gmail.com
+# Source code: https://github.com/con-mcleod/MonthlyPerf_Report
+
+import sqlite3, time, json, argparse
+import schema, runstats, catalog
+import all_sitesify, salesforcify, adjuster, genMonthlyReport, genReport
+
+# the pipeline stages in the order they run
+STAGES = ["ingest", "salesforce", "adjust", "report"]
+
+##############################
+#                            #
+# Shared state               #
+#                            #
+##############################
+
+class PipelineState(object):
+	"""
+	What the stages share in memory so each is read from dataset.db once per run,
+	e.g. the SMI and month lists after ingest and the supply dates and forecasts after
+	the Salesforce load. Anything a stage changes is dropped and read again when next needed
+	"""
+
+	def __init__(self, cxn):
+		self.cxn = cxn
+		self.SMIs = None
+		self.dates = None
+		self.last_date = None
+		self.supply_dates = None
+		self.forecasts = None
+
+	def load_encompass(self):
+		"""
+		Function to read the SMI and month lists and the last day from the catalog if not yet read
+		:return:
+		"""
+		if self.SMIs is None:
+			self.SMIs = catalog.get_all_SMIs(self.cxn)
+			self.dates = catalog.get_all_months(self.cxn)
+			self.last_date = catalog.get_last_date(self.cxn)
+
+	def load_salesforce(self):
+		"""
+		Function to read the supply dates and forecasts from the Salesforce tables if not yet read
+		:return:
+		"""
+		if self.forecasts is None:
+			self.supply_dates = self.cxn.execute("SELECT SMI, supply_date from SMI_DETAILS").fetchall()
+			self.forecasts = self.cxn.execute(
+				"SELECT SMI, month, val from FORECAST order by SMI, month").fetchall()
+
+	def encompass_changed(self):
+		"""
+		Function to drop the SMI and month lists after DAILY_GEN changes
+		:return:
+		"""
+		self.SMIs = None
+		self.dates = None
+		self.last_date = None
+
+	def salesforce_changed(self):
+		"""
+		Function to drop the supply dates and forecasts after the Salesforce tables change
+		:return:
+		"""
+		self.supply_dates = None
+		self.forecasts = None
+
+##############################
+#                            #
+# Stages                     #
+#                            #
+##############################
+
+def run_ingest(state, args, stats):
+	"""
+	Function to load the Encompass reports into DAILY_GEN, as all_sitesify.py does
+	:param state: the PipelineState
+	:param args: the parsed arguments
+	:param stats: RunStats for the stage
+	:return:
+	"""
+	cxn = state.cxn
+	all_sitesify.set_pragmas(cxn, **all_sitesify.LOAD_PRAGMAS)
+	all_sitesify.create_tables(cxn, args.incremental)
+	data_count, SMI_count, row_total = all_sitesify.ingest_folder(cxn, args.encompass,
+		args.batch_size, args.workers, stats)
+	all_sitesify.set_pragmas(cxn, **all_sitesify.DEFAULT_PRAGMAS)
+	state.encompass_changed()
+	print ("Loaded " + str(row_total) + " rows for " + str(SMI_count) + " unique SMIs")
+
+
+def run_salesforce(state, args, stats):
+	"""
+	Function to load the Salesforce report into SMI_DETAILS and FORECAST, as salesforcify.py does
+	:param state: the PipelineState
+	:param args: the parsed arguments
+	:param stats: RunStats for the stage
+	:return:
+	"""
+	salesforcify.create_tables(state.cxn)
+	SMI_count, changed_count = salesforcify.load_salesforce_report(state.cxn, args.salesforce, stats)
+	if changed_count:
+		state.salesforce_changed()
+	print ("Collected details for " + str(SMI_count) + " unique SMIs, " + str(changed_count)
+		+ " changed since the last report")
+
+
+def run_adjust(state, args, stats):
+	"""
+	Function to build MONTH_GEN, ADJ_FORECAST and PERF_SUMMARY, as adjuster.py does
+	:param state: the PipelineState
+	:param args: the parsed arguments
+	:param stats: RunStats for the stage
+	:return:
+	"""
+	adjuster.create_tables(state.cxn, args.incremental)
+	with stats.timer("query"):
+		state.load_encompass()
+		if args.engine == "numpy":
+			state.load_salesforce()
+	adjuster.adjust(state.cxn, state.SMIs, state.dates, args.engine, args.incremental, stats,
+		state.forecasts, state.supply_dates)
+
+
+def run_report(state, args, stats):
+	"""
+	Function to write the All_sites and Perf Report sheets, as genReport.py does
+	:param state: the PipelineState
+	:param args: the parsed arguments
+	:param stats: RunStats for the stage
+	:return:
+	"""
+	with stats.timer("query"):
+		state.load_encompass()
+		state.load_salesforce()
+	last_date = state.last_date
+	report = str(last_date[2])+"."+str(last_date[1])+"."+str(last_date[0])
+	output = genReport.generate_report(state.cxn, report, state.SMIs, state.dates, stats,
+		args.low, args.high, args.conditional_format, args.shard_by, args.report_workers,
+		state.forecasts)
+	print ("Written " + output)
+
+
+# the function running each stage
+stageFunctions = {
+	"ingest": run_ingest,
+	"salesforce": run_salesforce,
+	"adjust": run_adjust,
+	"report": run_report,
+}
+
+
+def get_stages(first, last):
+	"""
+	Function to list the stages from first to last inclusive
+	:param first: the first stage to run
+	:param last: the last stage to run
+	:return: list of stage names in the order they run
+	"""
+	start = STAGES.index(first)
+	end = STAGES.index(last)
+	if end < start:
+		exit("--to " + last + " comes before --from " + first)
+	return STAGES[start:end+1]
+
+##############################
+#                            #
+# RUN PIPELINE               #
+#                            #
+##############################
+
+if __name__ == '__main__':
+
+	# terminate program if not executed correctly
+	parser = argparse.ArgumentParser(description="Run the ingest, Salesforce load, adjust and "
+		+ "report stages in one process, or any contiguous run of them")
+	parser.add_argument("--from", dest="first", choices=STAGES, default=STAGES[0],
+		help="first stage to run (default %(default)s)")
+	parser.add_argument("--to", dest="last", choices=STAGES, default=STAGES[-1],
+		help="last stage to run (default %(default)s)")
+	parser.add_argument("--encompass", metavar="FOLDER",
+		help="the Encompass reports folder, needed for the ingest stage")
+	parser.add_argument("--salesforce", metavar="FILE",
+		help="the Salesforce report, needed for the salesforce stage")
+	parser.add_argument("--incremental", action="store_true",
+		help="only ingest new or changed files and only recompute the cells they change")
+	parser.add_argument("--batch-size", type=int, default=all_sitesify.BATCH_SIZE,
+		help="rows buffered per executemany during ingest (default %(default)s)")
+	parser.add_argument("--workers", type=int, default=1,
+		help="processes used to parse Encompass files (default %(default)s)")
+	parser.add_argument("--engine", choices=["sql", "numpy"], default="sql",
+		help="compute ADJ_FORECAST in sqlite or with NumPy arrays (default %(default)s)")
+	genMonthlyReport.add_format_arguments(parser)
+	parser.add_argument("--shard-by", choices=genReport.shardColumns,
+		help="write one workbook per state, installer or site type plus an index workbook")
+	parser.add_argument("--report-workers", type=int, default=1,
+		help="processes writing shard workbooks (default %(default)s)")
+	runstats.add_arguments(parser)
+	args = parser.parse_args()
+
+	stages = get_stages(args.first, args.last)
+	if "ingest" in stages and not args.encompass:
+		parser.error("the ingest stage needs --encompass FOLDER")
+	if "salesforce" in stages and not args.salesforce:
+		parser.error("the salesforce stage needs --salesforce FILE")
+
+	# one connection and one set of shared lists for every stage
+	DATABASE = "dataset.db"
+	cxn = sqlite3.connect(DATABASE)
+	schema.migrate(cxn)
+	state = PipelineState(cxn)
+
+	reports = []
+	start = time.time()
+	for stage in stages:
+		print ("Running " + stage)
+		stats = runstats.start(stage, args, cxn)
+		stageFunctions[stage](state, args, stats)
+		reports.append(stats.report())
+	cxn.close()
+
+	print ("Complete! Ran " + ", ".join(stages) + " in " + "%.1f" % (time.time() - start) + "s")
+	if args.stats:
+		with open(args.stats, "w") as f:
+			json.dump(reports, f, indent=2)
+		print ("Run report written to " + args.stats)
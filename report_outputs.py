@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+
+# Author: Connor McLeod
+# Contact: con.mcleod92@gmail.com
+# Source code: https://github.com/con-mcleod/MonthlyPerf_Report
+
+import csv, json
+
+##############################
+#                            #
+# Helper functions           #
+#                            #
+##############################
+
+def output_path(output, sheet, fmt):
+	"""
+	Function to name the file a sheet is written to in a non-Excel format
+	:param output: the report name in YY.MM.DD format
+	:param sheet: the sheet the file replaces, e.g. All_sites
+	:param fmt: the output format
+	:return: the file name, e.g. 18.6.23_All_sites.csv
+	"""
+	return output + "_" + sheet.replace(" ", "_") + "." + fmt
+
+
+def unique_headings(headings):
+	"""
+	Function to make repeated headings unique, as pandas does, so they can be used as keys
+	:param headings: list of column headings
+	:return result: list of headings with repeats numbered e.g. Shortfall $.1
+	"""
+	seen = {}
+	result = []
+	for heading in headings:
+		if heading in seen:
+			seen[heading] += 1
+			result.append(heading + "." + str(seen[heading]))
+		else:
+			seen[heading] = 0
+			result.append(heading)
+	return result
+
+
+def pad_row(row, width):
+	"""
+	Function to pad a short row with empty values to the width of the headings
+	:param row: list of values
+	:param width: number of headings
+	:return: list of width values
+	"""
+	return list(row) + [None]*(width - len(row))
+
+##############################
+#                            #
+# Output formats             #
+#                            #
+##############################
+
+def write_csv(path, headings, rows):
+	"""
+	Function to stream rows to a csv file
+	:param path: the file to write
+	:param headings: list of column headings
+	:param rows: iterable of lists of values
+	:return:
+	"""
+	with open(path, "w", newline="") as f:
+		writer = csv.writer(f)
+		writer.writerow(headings)
+		for row in rows:
+			writer.writerow(pad_row(row, len(headings)))
+
+
+def write_jsonl(path, headings, rows):
+	"""
+	Function to stream rows to a JSON Lines file with one object per SMI
+	:param path: the file to write
+	:param headings: list of column headings, repeats are numbered
+	:param rows: iterable of lists of values
+	:return:
+	"""
+	keys = unique_headings(headings)
+	with open(path, "w") as f:
+		for row in rows:
+			f.write(json.dumps(dict(zip(keys, pad_row(row, len(keys))))) + "\n")
+
+
+def write_npz(path, headings, rows):
+	"""
+	Function to write rows as one compressed NumPy array per column
+	Numeric columns are float64 with NaN for missing values and the others are strings,
+	read back with np.load(path)["headings"] and np.load(path)["col0"] and so on
+	:param path: the file to write
+	:param headings: list of column headings
+	:param rows: iterable of lists of values
+	:return:
+	"""
+	# NumPy is only needed for this format
+	import numpy as np
+
+	columns = [[] for heading in headings]
+	for row in rows:
+		for column, val in zip(columns, pad_row(row, len(headings))):
+			column.append(val)
+
+	arrays = {"headings": np.array(headings)}
+	for i, column in enumerate(columns):
+		vals = [val for val in column if val is not None and val != '']
+		if all(isinstance(val, (int, float)) for val in vals):
+			arrays["col" + str(i)] = np.array([np.nan if val is None or val == '' else val
+				for val in column], dtype=np.float64)
+		else:
+			arrays["col" + str(i)] = np.array(['' if val is None else str(val) for val in column])
+	np.savez_compressed(path, **arrays)
+
+
+# the non-Excel output formats by name
+OUTPUT_FORMATS = {
+	"csv": write_csv,
+	"jsonl": write_jsonl,
+	"npz": write_npz,
+}
+
+
+def write_rows(fmt, path, headings, rows):
+	"""
+	Function to write rows in one of the non-Excel output formats
+	:param fmt: the output format, a key of OUTPUT_FORMATS
+	:param path: the file to write
+	:param headings: list of column headings
+	:param rows: iterable of lists of values
+	:return:
+	"""
+	OUTPUT_FORMATS[fmt](path, headings, rows)
@@ -0,0 +1,235 @@
+#!/usr/bin/python3
+
+# Author: Connor McLeod
+# Contact: con.mcleod92@gmail.com
+# Source code: https://github.com/con-mcleod/MonthlyPerf_Report
+
+import sys, time, json, platform
+from contextlib import contextmanager
+
+# the resource module is not available on Windows, where peak memory is not reported
+try:
+	import resource
+except ImportError:
+	resource = None
+
+##############################
+#                            #
+# Run statistics             #
+#                            #
+##############################
+
+def get_peak_rss():
+	"""
+	Function to return the peak resident memory of this process so far
+	:return: peak RSS in KB, or None where it cannot be measured
+	"""
+	if resource is None:
+		return None
+	peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	if sys.platform == "darwin":
+		peak_rss //= 1024
+	return peak_rss
+
+
+class RunStats(object):
+	"""
+	Timers, counters and peak memory for one run of a pipeline script, reported as JSON
+	and optionally as a progress line that is redrawn at most once per interval
+	"""
+
+	def __init__(self, stage, progress=False, interval=1.0, verbose=False):
+		self.stage = stage
+		self.show_progress = progress
+		self.verbose = verbose
+		self.interval = interval
+		self.start = time.time()
+		self.timers = {}
+		self.counters = {}
+		self.memory = {}
+		self.last_progress = 0
+		self.progress_start = None
+		self.progress_label = None
+		self.started = {}
+
+	def begin(self, name):
+		"""
+		Function to start timing a phase of the run
+		:param name: the phase, e.g. parse, query, compute or write
+		:return:
+		"""
+		self.started[name] = time.perf_counter()
+
+	def end(self, name):
+		"""
+		Function to stop timing a phase, adding to any earlier time for the same name
+		The peak memory at the end of the phase is sampled too
+		:param name: the phase started with begin
+		:return:
+		"""
+		self.add_time(name, time.perf_counter() - self.started.pop(name))
+		self.memory[name] = get_peak_rss()
+
+	@contextmanager
+	def timer(self, name):
+		"""
+		Function to time a phase of the run around a with block, as begin and end do
+		:param name: the phase, e.g. parse, query, compute or write
+		:return:
+		"""
+		self.begin(name)
+		try:
+			yield
+		finally:
+			self.end(name)
+
+	def add_time(self, name, seconds):
+		"""
+		Function to add time to a phase
+		:param name: the phase
+		:param seconds: the time to add
+		:return:
+		"""
+		self.timers[name] = self.timers.get(name, 0) + seconds
+
+	def count(self, name, num=1):
+		"""
+		Function to add to a counter
+		:param name: the counter, e.g. rows or cells
+		:param num: the amount to add
+		:return:
+		"""
+		self.counters[name] = self.counters.get(name, 0) + num
+
+	def watch_queries(self, cxn):
+		"""
+		Function to count every statement sqlite runs on a connection under "statement_rows"
+		sqlite traces an executemany once per row, so the count is statements plus rows
+		This costs a Python call per statement so it is only done when a report is asked for
+		:param cxn: connection to the sqlite3 database
+		:return:
+		"""
+		self.counters.setdefault("statement_rows", 0)
+		cxn.set_trace_callback(lambda statement: self.count("statement_rows"))
+
+	def list_SMIs(self, message, SMIs):
+		"""
+		Function to print how many SMIs something applies to, listing them only when verbose
+		:param message: what applies to them, e.g. "have no supply date"
+		:param SMIs: list of the SMIs
+		:return:
+		"""
+		if not SMIs:
+			return
+		print (str(len(SMIs)) + " SMIs " + message)
+		if self.verbose:
+			for SMI in SMIs:
+				print ("  " + SMI)
+
+	def start_progress(self, label=None):
+		"""
+		Function to start a new progress line, for a stage that works through its items
+		more than once, so its count and throughput start again from zero
+		:param label: what this pass is, shown after the stage, e.g. the sheet name
+		:return:
+		"""
+		self.progress_start = None
+		self.last_progress = 0
+		self.progress_label = label
+
+	def progress(self, done, total, unit="SMIs"):
+		"""
+		Function to redraw the progress line with the throughput so far, at most once
+		per interval and always for the last item
+		:param done: number of items done
+		:param total: number of items in all, or None while it is not known
+		:param unit: what the items are
+		:return:
+		"""
+		if not self.show_progress:
+			return
+		now = time.time()
+		if self.progress_start is None:
+			self.progress_start = now
+			self.last_progress = now
+		finished = total is not None and done >= total
+		if now - self.last_progress < self.interval and not finished:
+			return
+		self.last_progress = now
+		rate = done / max(now - self.progress_start, 1e-6)
+		count = str(done)
+		if total is not None:
+			count += "/" + str(total)
+		name = self.stage
+		if self.progress_label:
+			name += " " + self.progress_label
+		sys.stderr.write("\r" + name + ": " + count + " " + unit
+			+ " (" + "%.0f" % rate + " " + unit + "/s)")
+		if finished:
+			sys.stderr.write("\n")
+		sys.stderr.flush()
+
+	def report(self):
+		"""
+		Function to summarise the run
+		:return: dictionary of the stage, wall time, phase times, counters and memory
+		"""
+		return {
+			"stage": self.stage,
+			"started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.start)),
+			"wall": round(time.time() - self.start, 3),
+			"timers": dict([(name, round(seconds, 3)) for name, seconds in self.timers.items()]),
+			"counters": self.counters,
+			"peak_rss_kb": get_peak_rss(),
+			"phase_peak_rss_kb": self.memory,
+			"python": platform.python_version(),
+		}
+
+	def write(self, path):
+		"""
+		Function to write the run report to a JSON file
+		:param path: the file to write
+		:return:
+		"""
+		with open(path, "w") as f:
+			json.dump(self.report(), f, indent=2)
+
+
+def add_arguments(parser):
+	"""
+	Function to add the run report and progress options to a script's command line parser
+	:param parser: the argparse parser
+	:return:
+	"""
+	parser.add_argument("--stats", metavar="FILE",
+		help="write a JSON run report with phase times, counters and peak memory to FILE")
+	parser.add_argument("--progress", action="store_true",
+		help="show a progress line with throughput on stderr")
+	parser.add_argument("--verbose", action="store_true",
+		help="list every SMI a warning applies to rather than just how many there are")
+
+
+def start(stage, args, cxn=None):
+	"""
+	Function to start the statistics for a script from its parsed arguments
+	:param stage: the script name
+	:param args: the parsed arguments including those from add_arguments
+	:param cxn: connection to count queries on when a run report is asked for
+	:return stats: the RunStats
+	"""
+	stats = RunStats(stage, args.progress, verbose=args.verbose)
+	if args.stats and cxn is not None:
+		stats.watch_queries(cxn)
+	return stats
+
+
+def finish(stats, args):
+	"""
+	Function to write the run report if one was asked for
+	:param stats: the RunStats
+	:param args: the parsed arguments including those from add_arguments
+	:return:
+	"""
+	if args.stats:
+		stats.write(args.stats)
+		print ("Run report written to " + args.stats)
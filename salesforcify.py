@@ -5,10 +5,38 @@
 # Source code: https://github.com/con-mcleod/MonthlyPerf_Report
 # Latest Update: 10 August 2018
 
-import sys, csv, sqlite3, os, glob, re
-from xlrd import open_workbook
-from datetime import datetime
+import sys, csv, sqlite3, os, glob, re, argparse
+from collections import deque
+from datetime import datetime, date
 import time
+import schema, runstats
+
+# patterns matched against each Salesforce heading in turn and the field the first match names,
+# month forecasts being named by the month number
+headingPatterns = [(re.compile(pattern), field) for pattern, field in [
+	('SMI', "SMI"), ('Reference', "ref_no"), ('ECS', "ECS"), ('Installer', "installer"),
+	('Size', "PVsize"), ('Brand', "panel_brand"), ('Address', "address"),
+	('Postcode', "postcode"), ('State', "state"), ('PPA', "site_status"),
+	('Installation Date', "install_date"), ('Supply', "supply_date"),
+	('Export', "export_control"), ('Tariff', "tariff"), ('January', 1), ('February', 2),
+	('March', 3), ('April', 4), ('May', 5), ('June', 6), ('July', 7), ('August', 8),
+	('September', 9), ('October', 10), ('November', 11), ('December', 12)]]
+
+# rows of totals and filters Salesforce adds below the report, in every export format
+footerRows = 6
+
+# each Salesforce table and the temporary table the report is staged in before diffing
+stagedTables = [("SMI_DETAILS", "temp.SF_DETAILS"), ("FORECAST", "temp.SF_FORECAST")]
+
+# sites buffered before each batch of inserts, so a streamed report loads in constant memory
+BATCH_SIZE = 5000
+
+# excel stores dates as days since this date
+excelEpoch = datetime(1899, 12, 30)
+
+# dates in a csv export, day first as Salesforce writes them in Australia, or ISO
+csvDatePatterns = [(re.compile(r'^\d{1,2}/\d{1,2}/\d{4}$'), "%d/%m/%Y"),
+	(re.compile(r'^\d{4}-\d{2}-\d{2}$'), "%Y-%m-%d")]
 
 ##############################
 #                            #
@@ -25,32 +53,17 @@ def create_tables(cxn):
 
 	cursor = cxn.cursor()
 
-	cursor.execute("DROP TABLE IF EXISTS SMI_DETAILS")
-	cursor.execute("DROP TABLE IF EXISTS FORECAST")
-
-	cursor.execute("""CREATE TABLE IF NOT EXISTS SMI_DETAILS(
-		SMI varchar(10),
-		ref_no varchar(40),
-		ECS varchar(150),
-		installer varchar(60),
-		PVsize float,
-		panel_brand varchar(100),
-		address varchar(150),
-		postcode int,
-		state varchar(10),
-		site_status varchar(80),
-		install_date date,
-		supply_date date,
-		tariff varchar(25),
-		export_control int check(export_control in (0,1)),
-		site_type varchar(8)
-		)""")
-
-	cursor.execute("""CREATE TABLE IF NOT EXISTS FORECAST(
-		SMI varchar(10),
-		month int,
-		val float
-		)""")
+	# the previous report is kept so only the sites that changed are rewritten
+	schema.create_table(cxn, "DIRTY_SMIS")
+	schema.create_table(cxn, "SMI_DETAILS")
+	schema.create_table(cxn, "FORECAST")
+
+	# and the new report is staged alongside it
+	for table, staged in stagedTables:
+		cursor.execute("DROP TABLE IF EXISTS " + staged)
+		schema.create_table(cxn, table, table=staged)
+	cursor.execute("DROP TABLE IF EXISTS temp.SF_CHANGED")
+	schema.create_table(cxn, "DIRTY_SMIS", table="temp.SF_CHANGED")
 
 	cursor.close()
 
@@ -93,6 +106,18 @@ def dbexecute(cxn, query, payload):
 	else:
 		cursor.execute(query, payload)
 
+def dbexecutemany(cxn, query, payloads):
+	"""
+	Function to execute an sqlite3 table insertion for many rows at once
+	:param cxn: connection to the sqlite3 database
+	:param query: the query to be run
+	:param payloads: list of payloads, one per row
+	:return:
+	"""
+	cursor = cxn.cursor()
+	cursor.executemany(query, payloads)
+	cursor.close()
+
 ##############################
 #                            #
 # Helper functions           #
@@ -108,160 +133,260 @@ def cols_to_nums(headings):
 	:return headings_nums: a dictionary which has an ordered list of required headings
 	"""
 	heading_nums = {}
-	num = 0
-	for heading in headings:
-		if re.search('SMI', heading):
-			heading = "SMI"
-		elif re.search('Reference', heading):
-			heading = "ref_no"
-		elif re.search('ECS', heading):
-			heading = "ECS"
-		elif re.search('Installer', heading):
-			heading = "installer"
-		elif re.search('Size', heading):
-			heading = "PVsize"
-		elif re.search('Brand', heading):
-			heading = "panel_brand"
-		elif re.search('Address', heading):
-			heading = "address"
-		elif re.search('Postcode', heading):
-			heading = "postcode"
-		elif re.search('State', heading):
-			heading = "state"
-		elif re.search('PPA', heading):
-			heading = "site_status"
-		elif re.search('Installation Date', heading):
-			heading = "install_date"
-		elif re.search('Supply', heading):
-			heading = "supply_date"
-		elif re.search('Export', heading):
-			heading = "export_control"
-		elif re.search('Tariff', heading):
-			heading = "tariff"
-		elif re.search('January', heading):
-			heading = 1
-		elif re.search('February', heading):
-			heading = 2
-		elif re.search('March', heading):
-			heading = 3
-		elif re.search('April', heading):
-			heading = 4
-		elif re.search('May', heading):
-			heading = 5
-		elif re.search('June', heading):
-			heading = 6
-		elif re.search('July', heading):
-			heading = 7
-		elif re.search('August', heading):
-			heading = 8
-		elif re.search('September', heading):
-			heading = 9
-		elif re.search('October', heading):
-			heading = 10
-		elif re.search('November', heading):
-			heading = 11
-		elif re.search('December', heading):
-			heading = 12
+	for num, heading in enumerate(headings):
+		for pattern, field in headingPatterns:
+			if pattern.search(heading):
+				heading = field
+				break
 		heading_nums[num] = heading
-		num += 1
 	return heading_nums
 
 
-def forecast_insert(cxn, SMI, month, value):
+def fields_to_cols(heading_nums):
+	"""
+	Function to invert the column to heading map so each row is read with one lookup per field
+	Where two columns have the same heading the last one is read, as it always has been
+	:param heading_nums: the dictionary from cols_to_nums
+	:return field_cols: dictionary of heading to column number, in the order first seen
 	"""
-	Function to insert data into the sqlite forecast table
+	field_cols = {}
+	for col, field in heading_nums.items():
+		field_cols[field] = col
+	return field_cols
+
+
+def forecast_insert_many(cxn, rows, table="FORECAST"):
+	"""
+	Function to insert a batch of rows into the sqlite forecast table
 	:param cxn: the connection to the sqlite3 database
-	:param SMI: the given SMI
-	:param month: the given month
-	:param value: the forecast value for that SMI and month from Salesforce report 
+	:param rows: list of (SMI, month, value) tuples
+	:param table: the table to insert into, e.g. the staging table
 	:return:
 	"""
-	query = """INSERT OR IGNORE INTO forecast(SMI, month, val)
+	query = """INSERT OR IGNORE INTO """ + table + """(SMI, month, val)
 				VALUES (?,?,?)"""
-	payload = (SMI, month, value)
-	dbexecute(cxn, query, payload)
+	dbexecutemany(cxn, query, rows)
 
 
-def smi_details_insert(cxn, SMI, ref_no, ECS, installer, PVsize, panel_brand, 
-					address, postcode, state, site_status, install_date, 
-					supply_date, tariff, export_control, site_type):
+def smi_details_insert_many(cxn, rows, table="SMI_DETAILS"):
 	"""
-	Function to insert data into the sqlite smi_details table
+	Function to insert a batch of rows into the sqlite smi_details table
 	:param cxn: the connection to the sqlite3 database
-	:param SMI: SMI from SF report
-	:param ref_no: reference number from SF report
-	:param ECS: ECS order number from SF report
-	:param installer: installer from SF report
-	:param PVsize: PV system size from SF report
-	:param panel_brand: panel make from SF report
-	:param address:	address from SF report
-	:param postcode: postcode from SF report
-	:param state: state from SF report
-	:param site_status: status of site from SF report
-	:param install_date: install date from SF report
-	:param supply_date: supply date from SF report
-	:param tariff: tariff as an integer from SF report
-	:param export_control: export control boolean from SF report
-	:param site_type: type of site (Resi, SME, C&I) from SF report
+	:param rows: list of (SMI, ref_no, ECS, installer, PVsize, panel_brand, address, postcode,
+		state, site_status, install_date, supply_date, tariff, export_control, site_type) tuples
+	:param table: the table to insert into, e.g. the staging table
 	:return:
 	"""
-	query = """INSERT OR IGNORE into SMI_DETAILS(SMI, ref_no, ECS, installer, 
+	query = """INSERT OR IGNORE into """ + table + """(SMI, ref_no, ECS, installer, 
 				PVsize, panel_brand, address, postcode, state, site_status, 
 				install_date, supply_date, tariff, export_control, site_type) 
 				VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)"""
-	payload = (SMI, ref_no, ECS, installer, PVsize, panel_brand, 
-					address, postcode, state, site_status, install_date, 
-					supply_date, tariff, export_control, site_type)
-	dbexecute(cxn, query, payload)
-	
+	dbexecutemany(cxn, query, rows)
+
+
+def find_changed_SMIs(cxn):
+	"""
+	Function to find the SMIs whose details or forecasts differ between the staged report
+	and the tables, which includes sites added to or removed from the report
+	:param cxn: the connection to the sqlite3 database with the report staged
+	:return: the number of changed SMIs, which are left in temp.SF_CHANGED
+	"""
+	query = "INSERT OR IGNORE INTO temp.SF_CHANGED(SMI) SELECT SMI from ({0} EXCEPT {1})"
+	for table, staged in stagedTables:
+		dbexecute(cxn, query.format("SELECT * from " + staged, "SELECT * from " + table), None)
+		dbexecute(cxn, query.format("SELECT * from " + table, "SELECT * from " + staged), None)
+	return dbselect(cxn, "SELECT count(*) from temp.SF_CHANGED", None)[0][0]
+
+
+def apply_changed_SMIs(cxn):
+	"""
+	Function to replace the rows of the changed SMIs with their staged rows and record
+	them as changed so the adjuster recomputes only them in incremental mode
+	:param cxn: the connection to the sqlite3 database after find_changed_SMIs
+	:return:
+	"""
+	for table, staged in stagedTables:
+		dbexecute(cxn, "DELETE FROM " + table + " where SMI in (SELECT SMI from temp.SF_CHANGED)",
+			None)
+		dbexecute(cxn, "INSERT INTO " + table + " SELECT * from " + staged
+			+ " where SMI in (SELECT SMI from temp.SF_CHANGED)", None)
+	dbexecute(cxn, "INSERT OR IGNORE INTO DIRTY_SMIS(SMI) SELECT SMI from temp.SF_CHANGED", None)
+	for table, staged in stagedTables + [("DIRTY_SMIS", "temp.SF_CHANGED")]:
+		dbexecute(cxn, "DROP TABLE " + staged, None)
 
 ##############################
 #                            #
-# READ IN SALESFORCE REPORT  #
+# Salesforce readers         #
 #                            #
 ##############################
 
-if __name__ == '__main__':
+# Each reader streams the rows of a Salesforce report, headings first, with the values
+# as xlrd gives them: numbers and dates as floats (dates being Excel day numbers), text as
+# strings and empty cells as ''
 
-	# terminate program if not executed correctly
-	if (len(sys.argv) != 2):
-		print ("Usage: python3 salesforcify.py <SF file>")
-		exit(1)
+def excel_serial(val):
+	"""
+	Function to turn a date into the Excel day number an .xls report holds for it
+	:param val: datetime or date
+	:return: days since excelEpoch as a float
+	"""
+	if not isinstance(val, datetime):
+		val = datetime(val.year, val.month, val.day)
+	return (val - excelEpoch).total_seconds() / 86400
 
-	# connect to the database and create the tables
-	DATABASE = "dataset.db"
-	cxn = sqlite3.connect(DATABASE)
-	create_tables(cxn)
 
-	# read from Salesforce excel file using xlrd package
-	SF_file = sys.argv[1]
-	wb = open_workbook(SF_file)
-	sheet = wb.sheet_by_index(0)
+def read_xls_rows(SF_file):
+	"""
+	Function to read the rows of an .xls report with xlrd, which loads the whole workbook
+	:param SF_file: the Salesforce report
+	:return: tuple of (row iterator, number of rows)
+	"""
+	# xlrd is only needed for .xls reports
+	from xlrd import open_workbook
+
+	sheet = open_workbook(SF_file).sheet_by_index(0)
+	return (sheet.row_values(row) for row in range(sheet.nrows)), sheet.nrows
+
+
+def stream_xlsx_rows(wb):
+	"""
+	Function to stream the rows of a read-only workbook's first sheet and close it at the end
+	:param wb: openpyxl workbook opened read-only
+	:return: generator of rows
+	"""
+	try:
+		for row in wb.worksheets[0].iter_rows(values_only=True):
+			vals = []
+			for val in row:
+				if val is None:
+					val = ''
+				elif isinstance(val, bool):
+					val = int(val)
+				elif isinstance(val, (int, float)):
+					val = float(val)
+				elif isinstance(val, (datetime, date)):
+					val = excel_serial(val)
+				vals.append(val)
+			yield vals
+	finally:
+		wb.close()
+
+
+def read_xlsx_rows(SF_file):
+	"""
+	Function to stream the rows of an .xlsx report with openpyxl in read-only mode,
+	holding one row in memory at a time
+	:param SF_file: the Salesforce report
+	:return: tuple of (row iterator, None as the number of rows is not read up front)
+	"""
+	from openpyxl import load_workbook
+
+	wb = load_workbook(SF_file, read_only=True, data_only=True)
+	return stream_xlsx_rows(wb), None
+
+
+def stream_csv_rows(SF_file):
+	"""
+	Function to stream the rows of a csv report, turning its dates into Excel day numbers
+	:param SF_file: the Salesforce report
+	:return: generator of rows
+	"""
+	with open(SF_file, newline="", encoding="utf-8-sig") as SF_in:
+		for row in csv.reader(SF_in):
+			for i, val in enumerate(row):
+				for pattern, date_format in csvDatePatterns:
+					if pattern.match(val):
+						row[i] = excel_serial(datetime.strptime(val, date_format))
+						break
+			yield row
+
+
+def read_csv_rows(SF_file):
+	"""
+	Function to stream the rows of a csv export of the report
+	Numbers stay as text, which the loader converts where it needs a number
+	:param SF_file: the Salesforce report
+	:return: tuple of (row iterator, None as the number of rows is not read up front)
+	"""
+	return stream_csv_rows(SF_file), None
+
+
+# the reader for each Salesforce report file extension
+sfReaders = {
+	".xls": read_xls_rows,
+	".xlsx": read_xlsx_rows,
+	".xlsm": read_xlsx_rows,
+	".csv": read_csv_rows,
+}
+
+
+def drop_footer(rows, num_footer):
+	"""
+	Function to stream rows holding back the last few, which are never yielded
+	:param rows: iterator of rows
+	:param num_footer: number of rows at the end to drop
+	:return: generator of rows
+	"""
+	held = deque()
+	for row in rows:
+		held.append(row)
+		if len(held) > num_footer:
+			yield held.popleft()
+
+
+def open_salesforce_report(SF_file):
+	"""
+	Function to open a Salesforce report in any of the sfReaders formats
+	:param SF_file: the Salesforce report
+	:return: tuple of (headings, iterator of site rows padded to the headings, number of
+		sites or None where it is not known up front)
+	"""
+	extension = os.path.splitext(SF_file)[1].lower()
+	if extension not in sfReaders:
+		exit("Cannot read " + SF_file + ", the Salesforce report must be one of "
+			+ ", ".join(sorted(sfReaders)))
+	rows, num_rows = sfReaders[extension](SF_file)
+	headings = [str(heading) for heading in next(rows, [])]
+	width = len(headings)
+	sites = (list(row) + ['']*(width - len(row)) for row in drop_footer(rows, footerRows))
+	num_sites = None
+	if num_rows is not None:
+		num_sites = max(num_rows - 1 - footerRows, 0)
+	return headings, sites, num_sites
 
-	# reads in the excel headings and allocates them to variables regardless of excel file order
-	num_rows = sheet.nrows - 6
-	num_cols = sheet.ncols
-	headings = []
+##############################
+#                            #
+# Salesforce load            #
+#                            #
+##############################
 
-	for row in range(0, 1):
-		for col in range(0, num_cols):
-			val = sheet.cell(row,col).value
-			headings.append(val)
+def load_salesforce_report(cxn, SF_file, stats):
+	"""
+	Function to load every site's details and forecasts from the Salesforce report
+	The report is staged in temporary tables and only the sites that differ from the
+	previous report are rewritten
+	:param cxn: connection to the sqlite3 database with the tables created
+	:param SF_file: the Salesforce report
+	:param stats: RunStats for the run
+	:return: tuple of (number of SMIs loaded, number of SMIs changed)
+	"""
+	# open the Salesforce report, which is streamed a row at a time unless it is .xls
+	with stats.timer("read"):
+		headings, rows, num_sites = open_salesforce_report(SF_file)
 
-	# function to assign headers to specific variables
+	# function to assign headers to specific variables, and the column each one is read from
 	headings_dict = cols_to_nums(headings)
+	field_cols = fields_to_cols(headings_dict)
 	SMI_count = 0
+	forecast_rows = []
+	detail_rows = []
 
-	# for each SMI grab the relevant data and store it into the sqlite tables
-	for row in range(1, num_rows):
+	# for each SMI grab the relevant data and buffer it for the sqlite tables
+	stats.begin("load")
+	for vals in rows:
 		results = {}
-		for col in range(0, num_cols):
-			val = sheet.cell(row,col).value
-			# val = re.sub(r'\"', '', val)
-
-			for dkey, dval in headings_dict.items():
-				if col == dkey:
-					results[dval] = val
+		for field, col in field_cols.items():
+			results[field] = vals[col]
 
 		SMI = results["SMI"]
 		if isinstance(SMI,str) == False:
@@ -326,17 +451,65 @@ if __name__ == '__main__':
 				if value == "":
 					value = 0
 				value = float(value)
-				forecast_insert(cxn, SMI, key, value)
+				forecast_rows.append((SMI, key, value))
 				
-		print ("Collected SMI details for: " + SMI)
 		SMI_count += 1
+		stats.progress(SMI_count, num_sites)
 
 		# inesrt into the smi_details table the details for given smi
-		smi_details_insert(cxn, SMI, ref_no, ECS, installer, PVsize, panel_brand, address, postcode, state, 
-					site_status, install_date, supply_date, tariff, export_control, site_type)
+		detail_rows.append((SMI, ref_no, ECS, installer, PVsize, panel_brand, address, postcode, state, 
+					site_status, install_date, supply_date, tariff, export_control, site_type))
+
+		# write the sites so far in one batch per table, keeping the first row for any repeated SMI
+		if len(detail_rows) >= BATCH_SIZE:
+			forecast_insert_many(cxn, forecast_rows, "temp.SF_FORECAST")
+			smi_details_insert_many(cxn, detail_rows, "temp.SF_DETAILS")
+			forecast_rows = []
+			detail_rows = []
+
+	if num_sites is None:
+		stats.progress(SMI_count, SMI_count)
+
+	# and the remaining sites
+	forecast_insert_many(cxn, forecast_rows, "temp.SF_FORECAST")
+	smi_details_insert_many(cxn, detail_rows, "temp.SF_DETAILS")
+	stats.end("load")
+
+	# rewrite only the sites that changed since the previous report
+	with stats.timer("diff"):
+		changed_count = find_changed_SMIs(cxn)
+		apply_changed_SMIs(cxn)
+		cxn.commit()
+	stats.count("SMIs", SMI_count)
+	stats.count("changed_SMIs", changed_count)
+	return SMI_count, changed_count
+
+##############################
+#                            #
+# READ IN SALESFORCE REPORT  #
+#                            #
+##############################
+
+if __name__ == '__main__':
+
+	# terminate program if not executed correctly
+	parser = argparse.ArgumentParser(description="Load the Salesforce report into dataset.db")
+	parser.add_argument("SF_file")
+	runstats.add_arguments(parser)
+	args = parser.parse_args()
+
+	# connect to the database and create the tables
+	DATABASE = "dataset.db"
+	cxn = sqlite3.connect(DATABASE)
+	schema.migrate(cxn)
+	create_tables(cxn)
+	stats = runstats.start("salesforcify", args, cxn)
 
-	cxn.commit()
+	# read the sites from the Salesforce report into the sqlite tables
+	SMI_count, changed_count = load_salesforce_report(cxn, args.SF_file, stats)
 	cxn.close()
 
 	print ("Complete!")
-	print ("Collected details for " + str(SMI_count) + " unique SMIs")
\ No newline at end of file
+	print ("Collected details for " + str(SMI_count) + " unique SMIs, " + str(changed_count)
+		+ " changed since the last report")
+	runstats.finish(stats, args)
\ No newline at end of file
@@ -0,0 +1,499 @@
+#!/usr/bin/python3
+
+# Author: Connor McLeod
+# Contact: con.mcleod92@gmail.com
+# Source code: https://github.com/con-mcleod/MonthlyPerf_Report
+
+import sqlite3, argparse
+
+##############################
+#                            #
+# TABLE DEFINITIONS          #
+#                            #
+##############################
+
+# the current definition of every table in dataset.db, {table} is the table name
+TABLES = {
+	"SMI_DIM": """CREATE TABLE IF NOT EXISTS {table}(
+		smi_id integer primary key,
+		SMI varchar(10) unique
+		)""",
+
+	"DATATYPE_DIM": """CREATE TABLE IF NOT EXISTS {table}(
+		datatype_id integer primary key,
+		datatype varchar(30) unique
+		)""",
+
+	# day is the reading's date as a YYMMDD number, e.g. 180623, so each SMI's readings
+	# are stored in date order and a month of them is one range of the key
+	"DAILY_READINGS": """CREATE TABLE IF NOT EXISTS {table}(
+		smi_id int,
+		day int,
+		datatype_id int,
+		value float,
+		file_id int,
+		primary key(smi_id, day)
+		) WITHOUT ROWID""",
+
+	# the daily readings with their SMI, datatype and date spelled out, as they were stored
+	"DAILY_GEN": """CREATE VIEW IF NOT EXISTS {table} AS
+		SELECT s.SMI, t.datatype, r.day%100 as obs_day, r.day/100%100 as obs_month,
+			r.day/10000 as obs_year, r.value, r.file_id
+		from DAILY_READINGS r join SMI_DIM s on s.smi_id = r.smi_id
+		left join DATATYPE_DIM t on t.datatype_id = r.datatype_id""",
+
+	"INGEST_MANIFEST": """CREATE TABLE IF NOT EXISTS {table}(
+		file_id integer primary key,
+		path varchar(260) unique,
+		size int,
+		mtime float,
+		hash varchar(64),
+		ingested_at date
+		)""",
+
+	"SMI_DETAILS": """CREATE TABLE IF NOT EXISTS {table}(
+		SMI varchar(10) primary key,
+		ref_no varchar(40),
+		ECS varchar(150),
+		installer varchar(60),
+		PVsize float,
+		panel_brand varchar(100),
+		address varchar(150),
+		postcode int,
+		state varchar(10),
+		site_status varchar(80),
+		install_date date,
+		supply_date date,
+		tariff varchar(25),
+		export_control int check(export_control in (0,1)),
+		site_type varchar(8)
+		)""",
+
+	"FORECAST": """CREATE TABLE IF NOT EXISTS {table}(
+		SMI varchar(10),
+		month int,
+		val float,
+		primary key(SMI, month)
+		) WITHOUT ROWID""",
+
+	"ADJ_FORECAST": """CREATE TABLE IF NOT EXISTS {table}(
+		SMI varchar(10),
+		month int,
+		year int,
+		adj_val float,
+		primary key(SMI, year, month)
+		) WITHOUT ROWID""",
+
+	"MONTH_GEN": """CREATE TABLE IF NOT EXISTS {table}(
+		SMI varchar(10),
+		month int,
+		year int,
+		val float,
+		primary key(SMI, year, month)
+		) WITHOUT ROWID""",
+
+	# performance over each report period, built by the adjuster for the reports
+	"PERF_SUMMARY": """CREATE TABLE IF NOT EXISTS {table}(
+		SMI varchar(10),
+		period varchar(8),
+		fc float,
+		gen float,
+		perf float,
+		off_days int,
+		fc_revenue float,
+		gen_revenue float,
+		shortfall float,
+		primary key(SMI, period)
+		) WITHOUT ROWID""",
+
+	# changes recorded by ingest and the Salesforce load for incremental adjustment
+	"DIRTY_CELLS": """CREATE TABLE IF NOT EXISTS {table}(
+		SMI varchar(10),
+		month int,
+		year int,
+		primary key(SMI, year, month)
+		) WITHOUT ROWID""",
+
+	"DIRTY_SMIS": """CREATE TABLE IF NOT EXISTS {table}(
+		SMI varchar(10) primary key
+		) WITHOUT ROWID""",
+
+	# each SMI's first and last day and readings in each month, which the SMI and month
+	# catalogs are summed from so ingest only has to update the cells it changed
+	"CELL_CATALOG": """CREATE TABLE IF NOT EXISTS {table}(
+		SMI varchar(10),
+		obs_year int,
+		obs_month int,
+		first_day int,
+		last_day int,
+		readings int,
+		primary key(SMI, obs_year, obs_month)
+		) WITHOUT ROWID""",
+
+	"SMI_CATALOG": """CREATE TABLE IF NOT EXISTS {table}(
+		SMI varchar(10) primary key,
+		first_year int,
+		first_month int,
+		first_day int,
+		last_year int,
+		last_month int,
+		last_day int,
+		readings int
+		) WITHOUT ROWID""",
+
+	"MONTH_CATALOG": """CREATE TABLE IF NOT EXISTS {table}(
+		obs_month int,
+		obs_year int,
+		first_day int,
+		last_day int,
+		SMIs int,
+		readings int,
+		primary key(obs_year, obs_month)
+		) WITHOUT ROWID""",
+
+	# when the catalog was last brought up to date, in the format of INGEST_MANIFEST.ingested_at
+	"CATALOG_STATE": """CREATE TABLE IF NOT EXISTS {table}(
+		built_at date
+		)""",
+}
+
+# the indexes each table is created with, {table} is the table name
+INDEXES = {
+	# finds a file's readings when it is ingested again
+	"DAILY_READINGS": ["""CREATE INDEX IF NOT EXISTS {table}_FILE on {table}(file_id)"""],
+	# finds a month's cells when the month is summed again
+	"CELL_CATALOG": ["""CREATE INDEX IF NOT EXISTS {table}_MONTH on {table}(obs_year, obs_month)"""],
+}
+
+##############################
+#                            #
+# Table creation             #
+#                            #
+##############################
+
+def table_exists(cxn, name):
+	"""
+	Function to check whether a table exists in the database
+	:param cxn: connection to the sqlite3 database
+	:param name: the table name
+	:return: True if the table exists
+	"""
+	query = "SELECT 1 from sqlite_master where type='table' and name=?"
+	return bool(cxn.execute(query, (name,)).fetchall())
+
+
+def table_columns(cxn, name):
+	"""
+	Function to list the columns of a table
+	:param cxn: connection to the sqlite3 database
+	:param name: the table name
+	:return: list of column names in table order
+	"""
+	return [column[1] for column in cxn.execute("PRAGMA table_info(" + name + ")")]
+
+
+def create_indexes(cxn, name, table=None):
+	"""
+	Function to create any of a table's indexes that do not exist yet
+	:param cxn: connection to the sqlite3 database
+	:param name: the table name as listed in INDEXES
+	:param table: the table's name if it was created under another name
+	:return:
+	"""
+	for index in INDEXES.get(name, []):
+		cxn.execute(index.format(table=table or name))
+
+
+def create_table(cxn, name, table=None, indexes=True):
+	"""
+	Function to create a table and its indexes from its current definition
+	:param cxn: connection to the sqlite3 database
+	:param name: the table name as listed in TABLES
+	:param table: create the table under another name, e.g. for staging
+	:param indexes: False to leave the indexes to create_indexes, e.g. after a bulk load
+	:return:
+	"""
+	cxn.execute(TABLES[name].format(table=table or name))
+	if indexes:
+		create_indexes(cxn, name, table)
+
+##############################
+#                            #
+# Migrations                 #
+#                            #
+##############################
+
+def rebuild_table(cxn, name):
+	"""
+	Function to rebuild an existing table with its current definition, keeping its rows
+	Rows are copied in their original order with INSERT OR IGNORE so the first of any
+	duplicate keys is kept, matching what the scripts' lookups used to return
+	:param cxn: connection to the sqlite3 database
+	:param name: the table name as listed in TABLES
+	:return:
+	"""
+	if not table_exists(cxn, name):
+		return
+	old = name + "_old"
+	cxn.execute("DROP TABLE IF EXISTS " + old)
+	cxn.execute("ALTER TABLE " + name + " RENAME TO " + old)
+	create_table(cxn, name)
+	new_columns = table_columns(cxn, name)
+	columns = ", ".join([column for column in table_columns(cxn, old) if column in new_columns])
+	cxn.execute("INSERT OR IGNORE INTO " + name + "(" + columns + ") SELECT " + columns
+		+ " from " + old + " order by rowid")
+	cxn.execute("DROP TABLE " + old)
+
+
+def migrate_keys(cxn):
+	"""
+	Migration 1: primary keys for the lookup tables, clustered so the per-SMI lookups
+	are covered by the key, and the file_id column DAILY_GEN gained with the manifest
+	:param cxn: connection to the sqlite3 database
+	:return:
+	"""
+	for name in ["SMI_DETAILS", "FORECAST", "ADJ_FORECAST", "MONTH_GEN"]:
+		rebuild_table(cxn, name)
+	if table_exists(cxn, "DAILY_GEN") and "file_id" not in table_columns(cxn, "DAILY_GEN"):
+		cxn.execute("ALTER TABLE DAILY_GEN ADD COLUMN file_id int")
+
+
+def migrate_retired(cxn):
+	"""
+	Migration 2: no longer does anything and is kept so the later versions keep their
+	numbers; migration 4 rebuilds DAILY_GEN
+	:param cxn: connection to the sqlite3 database
+	:return:
+	"""
+	return
+
+
+def migrate_catalog(cxn):
+	"""
+	Migration 3: the catalog of SMIs and months in DAILY_GEN that the scripts read
+	instead of scanning DAILY_GEN, built from any data already loaded
+	:param cxn: connection to the sqlite3 database
+	:return:
+	"""
+	# imported here as catalog.py imports this module
+	import catalog
+
+	if table_exists(cxn, "DAILY_GEN"):
+		catalog.rebuild_catalog(cxn)
+
+
+def migrate_compact_daily_gen(cxn):
+	"""
+	Migration 4: store the daily readings in DAILY_READINGS with integer SMI and datatype
+	ids and a single day number, keyed (smi_id, day), leaving DAILY_GEN as a view of it.
+	Rows are copied in their original order with INSERT OR IGNORE so the first of any
+	duplicate days is kept, and the database is vacuumed to give back the space
+	:param cxn: connection to the sqlite3 database
+	:return:
+	"""
+	if not table_exists(cxn, "DAILY_GEN"):
+		return
+	cxn.execute("DROP TABLE IF EXISTS DAILY_GEN_OLD")
+	cxn.execute("ALTER TABLE DAILY_GEN RENAME TO DAILY_GEN_OLD")
+	for name in ["SMI_DIM", "DATATYPE_DIM", "DAILY_READINGS", "DAILY_GEN"]:
+		create_table(cxn, name)
+	cxn.execute("INSERT OR IGNORE INTO SMI_DIM(SMI) SELECT SMI from DAILY_GEN_OLD order by rowid")
+	cxn.execute("""INSERT OR IGNORE INTO DATATYPE_DIM(datatype)
+		SELECT datatype from DAILY_GEN_OLD where datatype is not null order by rowid""")
+	cxn.execute("""INSERT OR IGNORE INTO DAILY_READINGS(smi_id, day, datatype_id, value, file_id)
+		SELECT s.smi_id, o.obs_year*10000 + o.obs_month*100 + o.obs_day, t.datatype_id, o.value,
+			o.file_id
+		from DAILY_GEN_OLD o join SMI_DIM s on s.SMI = o.SMI
+		left join DATATYPE_DIM t on t.datatype = o.datatype order by o.rowid""")
+	cxn.execute("DROP TABLE DAILY_GEN_OLD")
+	cxn.commit()
+	cxn.execute("VACUUM")
+
+
+def migrate_file_index(cxn):
+	"""
+	Migration 5: index DAILY_READINGS by file_id so ingesting a changed file again
+	finds its old readings without scanning the whole table
+	:param cxn: connection to the sqlite3 database
+	:return:
+	"""
+	if table_exists(cxn, "DAILY_READINGS"):
+		create_indexes(cxn, "DAILY_READINGS")
+
+
+def migrate_cell_catalog(cxn):
+	"""
+	Migration 6: the per SMI and month catalog that lets ingest update the catalog for
+	just the cells it changed, built by rebuilding the catalog from any data already loaded
+	:param cxn: connection to the sqlite3 database
+	:return:
+	"""
+	# imported here as catalog.py imports this module
+	import catalog
+
+	if table_exists(cxn, "DAILY_READINGS") and not table_exists(cxn, "CELL_CATALOG"):
+		catalog.rebuild_catalog(cxn)
+
+
+# ordered list of (version, migration); append new migrations, never reorder them
+# version 2 is a no-op kept for numbering, it keyed the DAILY_GEN table that version 4 replaces
+MIGRATIONS = [
+	(1, migrate_keys),
+	(2, migrate_retired),
+	(3, migrate_catalog),
+	(4, migrate_compact_daily_gen),
+	(5, migrate_file_index),
+	(6, migrate_cell_catalog),
+]
+
+
+def migrate(cxn):
+	"""
+	Function to bring a database up to the current schema version
+	The version is kept in sqlite's user_version so each migration runs once
+	:param cxn: connection to the sqlite3 database
+	:return version: the schema version of the database
+	"""
+	version = cxn.execute("PRAGMA user_version").fetchone()[0]
+	for target, migration in MIGRATIONS:
+		if target > version:
+			migration(cxn)
+			cxn.execute("PRAGMA user_version=" + str(target))
+			cxn.commit()
+			version = target
+	return version
+
+##############################
+#                            #
+# Query plan check           #
+#                            #
+##############################
+
+# sample report months, July 2017 to June 2018, for the statements built per report
+planDates = [(month, 17) for month in range(7, 13)] + [(month, 18) for month in range(1, 7)]
+
+
+def hot_queries():
+	"""
+	Function to list the statements the scripts run against dataset.db, taken from the
+	scripts themselves, with sample parameters and the plan steps each is meant to take,
+	i.e. reading a small or whole table on purpose; any other table scan or temporary
+	b-tree fails the check. The cells to rebuild are read from the temp tables
+	temp.CATALOG_WORK and temp.ADJ_WORK
+	:return: list of (name, query, payload, allowed plan steps)
+	"""
+	# imported here as these scripts import this module
+	import all_sitesify, catalog, adjuster, genAllSites, genMonthlyReport
+
+	adj_forecast, adj_forecast_payload = adjuster.adj_forecast_query()
+	adj_forecast_cells, adj_forecast_cells_payload = adjuster.adj_forecast_query("temp.ADJ_WORK")
+	periods, off_days, off_days_payload = adjuster.off_days_query(planDates)
+	queries = [
+		# all_sitesify.py: planning and re-ingesting changed files
+		("all_sitesify manifest", all_sitesify.MANIFEST_SELECT, ("/enc.csv",), []),
+		("all_sitesify manifest touch", all_sitesify.MANIFEST_TOUCH, (1, 1.0, 1), []),
+		("all_sitesify changed file delete", all_sitesify.CHANGED_FILE_DELETE, (1,), []),
+
+		# catalog.py: the full rebuild and the update of the cells an ingest changed
+		("catalog cells", catalog.CELL_CATALOG_INSERT, (), ["SCAN r", "USE TEMP B-TREE FOR GROUP BY"]),
+		("catalog clear cells", "DELETE FROM CELL_CATALOG " + catalog.dirtyCells, (), []),
+		("catalog update cells", catalog.CELL_CATALOG_UPDATE, (), ["SCAN c"]),
+		("catalog clear SMIs", "DELETE FROM SMI_CATALOG " + catalog.dirtySMIs, (),
+			["SCAN temp.CATALOG_WORK"]),
+		("catalog update SMIs", catalog.SMI_CATALOG_INSERT.format(cells=catalog.dirtySMIs), (),
+			["SCAN temp.CATALOG_WORK", "SCAN (subquery-2)"]),
+		("catalog clear months", "DELETE FROM MONTH_CATALOG " + catalog.dirtyMonths, (),
+			["SCAN temp.CATALOG_WORK"]),
+		("catalog update months", catalog.MONTH_CATALOG_INSERT.format(cells=catalog.dirtyMonths),
+			(), ["SCAN temp.CATALOG_WORK", "USE TEMP B-TREE FOR GROUP BY"]),
+
+		# adjuster.py: MONTH_GEN and ADJ_FORECAST for every cell and for the changed cells
+		("adjuster MONTH_GEN", adjuster.month_gen_query(), (),
+			["SCAN SMI_DETAILS", "SCAN MONTH_CATALOG"]),
+		("adjuster incremental MONTH_GEN", adjuster.month_gen_query("temp.ADJ_WORK"), (),
+			["SCAN temp.ADJ_WORK"]),
+		("adjuster ADJ_FORECAST", adj_forecast, adj_forecast_payload,
+			["SCAN SMI_CATALOG", "SCAN MONTH_CATALOG"]),
+		("adjuster incremental ADJ_FORECAST", adj_forecast_cells, adj_forecast_cells_payload,
+			["SCAN temp.ADJ_WORK"]),
+
+		# adjuster.py: the changes recorded since the last run and the cells they clear; a
+		# month is only cleared on its own when it drops out of the reports
+		("adjuster dirty cells", adjuster.DIRTY_CELLS_SELECT, (), ["SCAN DIRTY_CELLS"]),
+		("adjuster dirty SMIs", adjuster.DIRTY_SMIS_SELECT, (), ["SCAN DIRTY_SMIS"]),
+		("adjuster built SMIs", adjuster.BUILT_SMIS_SELECT, (), ["SCAN ADJ_FORECAST"]),
+		("adjuster built months", adjuster.BUILT_MONTHS_SELECT, (),
+			["SCAN ADJ_FORECAST", "USE TEMP B-TREE FOR GROUP BY"]),
+		("adjuster clear cell", adjuster.CLEAR_CELL.format(table="MONTH_GEN"),
+			("6203778594", 6, 18), []),
+		("adjuster clear SMI", adjuster.CLEAR_SMI.format(table="ADJ_FORECAST"), ("6203778594",), []),
+		("adjuster clear month", adjuster.CLEAR_MONTH.format(table="MONTH_GEN"), (6, 18),
+			["SCAN MONTH_GEN"]),
+
+		# adjuster.py: off days in every report period, one key range per SMI
+		("adjuster off days", off_days, off_days_payload, ["SCAN s"]),
+
+		# the adjuster and reports read whole tables in SMI order
+		("adjuster ADJ_FORECAST by SMI", adjuster.FORECAST_BY_SMI, (), ["SCAN ADJ_FORECAST"]),
+		("adjuster MONTH_GEN by SMI", adjuster.GEN_BY_SMI, (), ["SCAN MONTH_GEN"]),
+		("genMonthlyReport ADJ_FORECAST", genMonthlyReport.FORECAST_BY_SMI, (),
+			["SCAN ADJ_FORECAST"]),
+		("genMonthlyReport MONTH_GEN", genMonthlyReport.GEN_BY_SMI, (), ["SCAN MONTH_GEN"]),
+		("genMonthlyReport PERF_SUMMARY", genMonthlyReport.PERF_BY_SMI, (), ["SCAN PERF_SUMMARY"]),
+		("genAllSites off days", genAllSites.OFF_DAYS_SELECT, (), ["SCAN PERF_SUMMARY"]),
+	]
+	# a changed file's cells go to DIRTY_CELLS and temp.CATALOG_WORK alike
+	for table in all_sitesify.dirtyTables:
+		queries.append(("all_sitesify changed file cells " + table,
+			all_sitesify.CHANGED_FILE_CELLS.format(table=table), (1,), []))
+	return queries
+
+
+def check_query_plans(cxn):
+	"""
+	Function to run EXPLAIN QUERY PLAN over the hot queries and find any that scan
+	a table or sort in a temporary b-tree instead of using an index, other than the
+	steps each query is allowed
+	:param cxn: connection to an sqlite3 database with every table created
+	:return failures: list of (query name, plan detail) for each offending step
+	"""
+	failures = []
+	for name, query, payload, allowed in hot_queries():
+		for step in cxn.execute("EXPLAIN QUERY PLAN " + query, payload):
+			detail = step[-1]
+			if detail in allowed:
+				continue
+			if detail.startswith("SCAN") or "TEMP B-TREE" in detail:
+				failures.append((name, detail))
+	return failures
+
+##############################
+#                            #
+# MIGRATE AND CHECK          #
+#                            #
+##############################
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description="Migrate dataset.db and check the hot query plans")
+	parser.add_argument("--database", default="dataset.db")
+	args = parser.parse_args()
+
+	# bring the database up to date and make sure every table exists to plan against
+	cxn = sqlite3.connect(args.database)
+	version = migrate(cxn)
+	for name in TABLES:
+		create_table(cxn, name)
+	for table in ["temp.CATALOG_WORK", "temp.ADJ_WORK"]:
+		create_table(cxn, "DIRTY_CELLS", table=table)
+	cxn.commit()
+	print ("Schema version " + str(version))
+
+	failures = check_query_plans(cxn)
+	cxn.close()
+	for name, detail in failures:
+		print ("Query plan for " + name + " does not use an index: " + detail)
+	if failures:
+		exit(1)
+
+	print ("Complete!")